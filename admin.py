@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from gigs.models import Gig, Artist, Review, Album, Venue, Town, Promoter,\
-    ImportIdentifier
+    ImportIdentifier, ArchivedImportIdentifier, EnrichmentJob, ProviderMiss,\
+    ImportRun
 
 
 class ImportIdentifierAdmin(admin.ModelAdmin):
@@ -14,6 +15,46 @@ class ImportIdentifierAdmin(admin.ModelAdmin):
     search_fields = ('identifier',)
 
 
+class ArchivedImportIdentifierAdmin(admin.ModelAdmin):
+
+    """Django ModelAdmin class for the ArchivedImportIdentifier model."""
+
+    date_hierarchy = 'archived'
+    list_display = ('identifier', 'type', 'object_id', 'archived')
+    list_filter = ('type',)
+    search_fields = ('identifier',)
+
+
+class EnrichmentJobAdmin(admin.ModelAdmin):
+
+    """Django ModelAdmin class for the EnrichmentJob model."""
+
+    list_display = ('task', 'object_id', 'priority', 'attempts', 'run_after',
+        'created')
+    list_filter = ('task', 'attempts')
+    ordering = ('-priority', 'run_after')
+
+
+class ProviderMissAdmin(admin.ModelAdmin):
+
+    """Django ModelAdmin class for the ProviderMiss model."""
+
+    list_display = ('artist', 'lookup', 'misses', 'next_check')
+    list_filter = ('lookup',)
+    list_select_related = True
+    search_fields = ('artist__name',)
+
+
+class ImportRunAdmin(admin.ModelAdmin):
+
+    """Django ModelAdmin class for the ImportRun model."""
+
+    date_hierarchy = 'started'
+    list_display = ('command', 'started', 'duration', 'queries',
+        'peak_memory')
+    list_filter = ('command',)
+
+
 class GigAdmin(admin.ModelAdmin):
 
     """Django ModelAdmin class for the Gig model."""
@@ -44,6 +85,7 @@ class ArtistAdmin(admin.ModelAdmin):
 
     """Django ModelAdmin class for the Artist model."""
 
+    actions = ('forget_provider_misses',)
     date_hierarchy = 'updated'
     fieldsets = (
         (None, {
@@ -61,6 +103,19 @@ class ArtistAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name',)
 
+    def forget_provider_misses(self, request, queryset):
+        """
+        Forget that Last.fm or MusicBrainz couldn't find the selected
+        artists, so they're looked up again next time, with the providers
+        asked afresh rather than the cached responses being used.
+        """
+        for artist in queryset:
+            ProviderMiss.objects.recheck(artist)
+        self.message_user(request, "The provider misses for %d artists "
+            "will be checked again." % len(queryset))
+    forget_provider_misses.short_description = 'Look up selected artists '\
+        'again on Last.fm and MusicBrainz'
+
 
 class ReviewAdmin(admin.ModelAdmin):
 
@@ -148,6 +203,10 @@ class PromoterAdmin(admin.ModelAdmin):
 
 
 admin.site.register(ImportIdentifier, ImportIdentifierAdmin)
+admin.site.register(ArchivedImportIdentifier, ArchivedImportIdentifierAdmin)
+admin.site.register(EnrichmentJob, EnrichmentJobAdmin)
+admin.site.register(ProviderMiss, ProviderMissAdmin)
+admin.site.register(ImportRun, ImportRunAdmin)
 admin.site.register(Gig, GigAdmin)
 admin.site.register(Artist, ArtistAdmin)
 admin.site.register(Review, ReviewAdmin)
@@ -0,0 +1,220 @@
+"""
+Measure how quickly ``import_gigs_from_ripping_records`` imports
+spreadsheets of different sizes.
+
+Realistic spreadsheets are generated -- month header rows, ``*DATE*``
+rows, ``--`` padding, the different forms of venue, promoter, and price
+cells, and misspelt artist names -- and imported from a local file into a
+new SQLite database, first into the empty database (a cold run) and then
+again (a warm run, as the regular import usually is).
+
+Run it from your project directory with your settings module set, e.g.::
+
+    DJANGO_SETTINGS_MODULE=settings python gigs/benchmarks/import_throughput.py
+
+Each import runs in a fresh Python process, so the peak memory use reported
+is for that import alone.  Logging is turned off while importing.
+"""
+import csv
+import datetime
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from optparse import OptionParser
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+# Number of gigs listed under each month header.
+GIGS_PER_MONTH = 250
+# Number of "--" rows Google pads the end of the spreadsheet with.
+PADDING_ROWS = 20
+# Chance of an artist's name being misspelt in a row.
+MISSPELLING_RATE = 0.05
+MONTH_NAMES = ('JANUARY', 'FEBRUARY', 'MARCH', 'APRIL', 'MAY', 'JUNE', 'JULY',
+    'AUGUST', 'SEPTEMBER', 'OCTOBER', 'NOVEMBER', 'DECEMBER')
+ARTIST_WORDS = (
+    ('The', 'Black', 'Young', 'Silver', 'Electric', 'Broken', 'Golden',
+        'Wild', 'Glass', 'Paper', 'Velvet', 'Northern', 'Quiet', 'Burning'),
+    ('Fall', 'Keys', 'Knives', 'Lights', 'Tigers', 'Rivers', 'Ghosts',
+        'Harbours', 'Animals', 'Machines', 'Hearts', 'Owls', 'Seas',
+        'Horses', 'Stations', 'Parades'),
+)
+VENUES = (
+    ('Liquid Room', 'Edinburgh'),
+    ('Usher Hall', 'Edinburgh'),
+    ('Corn Exchange', 'Edinburgh'),
+    ('Cabaret Voltaire', 'Edinburgh'),
+    ('Picture House', 'Edinburgh'),
+    ("Queen's Hall", 'Edinburgh'),
+    ('Barrowland', 'Glasgow'),
+    ("King Tut's", 'Glasgow'),
+    ('ABC', 'Glasgow'),
+    ('Oran Mor', 'Glasgow'),
+)
+PROMOTERS = ('RM', 'DF', 'PL', 'SMG', 'CC')
+EXTRA_INFORMATION = ('with support', 'over 14s', 'early show',
+    'rescheduled from May', 'plus guests')
+TEXT_ROWS = ('Tickets available in the shop or by phone.',
+    'Booking fees apply to phone orders.')
+
+RUN_IMPORT = """
+from django.conf import settings
+settings.DATABASE_ENGINE = 'sqlite3'
+settings.DATABASE_NAME = %(database)r
+settings.DEBUG = False
+settings.RIPPING_RECORDS_SPREADSHEET_URL = %(url)r
+import logging
+logging.disable(logging.CRITICAL)
+from django.core.management import call_command
+if %(cold)r:
+    call_command('syncdb', interactive=False, verbosity=0)
+call_command('import_gigs_from_ripping_records', report=%(report)r,
+    incremental=%(incremental)r)
+"""
+
+
+def day_with_suffix(date):
+    """Return a date's day in the spreadsheet's format, e.g. "Sat 17th"."""
+    if date.day in (11, 12, 13):
+        suffix = 'th'
+    else:
+        suffix = {1: 'st', 2: 'nd', 3: 'rd'}.get(date.day % 10, 'th')
+    return '%s %d%s' % (date.strftime('%a'), date.day, suffix)
+
+
+def misspell(name, rand):
+    """Return a name with a typo of the kind made in the spreadsheet."""
+    choice = rand.randint(0, 3)
+    if choice == 0 and name.startswith('The '):
+        return name[4:]
+    position = rand.randint(1, len(name) - 2)
+    if choice == 1:
+        return name[:position] + name[position + 1:]
+    if choice == 2:
+        return name[:position] + name[position + 1] + name[position] + \
+            name[position + 2:]
+    return name.lower()
+
+
+def venue_cell(rand):
+    """Return a venue cell, with or without a town and promoter."""
+    venue, town = rand.choice(VENUES)
+    promoter = rand.choice(PROMOTERS)
+    return rand.choice(['%s %s %s' % (venue, town, promoter),
+        '%s %s' % (venue, town), '%s %s' % (venue, promoter), venue])
+
+
+def price_cell(rand):
+    """Return a price cell in one of the forms the spreadsheet uses."""
+    price = rand.randint(8, 45) + rand.choice([0, 0.5])
+    return rand.choice([
+        '?%.2f' % price,
+        '?%.2f/?%.2f' % (price, price + 2.5),
+        '?%.2f SOLD OUT' % price,
+        '?%.2f %s' % (price, rand.choice(EXTRA_INFORMATION)),
+        'SOLD OUT',
+        'CANCELLED',
+    ])
+
+
+def generate_spreadsheet(path, rows, seed=0):
+    """
+    Write a CSV file like the Ripping Records spreadsheet to ``path``, with
+    ``rows`` gigs starting in the current month.
+    """
+    rand = random.Random(seed)
+    artists = ['%s %s' % (rand.choice(ARTIST_WORDS[0]),
+        rand.choice(ARTIST_WORDS[1])) for i in range(max(10, rows // 5))]
+    today = datetime.date.today()
+    year, month = today.year, today.month
+    fh = open(path, 'wb')
+    try:
+        writer = csv.writer(fh)
+        written = 0
+        while written < rows:
+            writer.writerow(['*%s %d*' % (MONTH_NAMES[month - 1], year)])
+            writer.writerow(['*DATE*', '*ARTIST*', '*VENUE*', '*PRICE*'])
+            number = min(GIGS_PER_MONTH, rows - written)
+            days = [rand.randint(1, 28) for i in range(number)]
+            days.sort()
+            for day in days:
+                artist = rand.choice(artists)
+                if rand.random() < MISSPELLING_RATE:
+                    artist = misspell(artist, rand)
+                writer.writerow([day_with_suffix(datetime.date(year, month,
+                    day)), artist, venue_cell(rand), price_cell(rand)])
+                if rand.random() < 0.01:
+                    writer.writerow([rand.choice(TEXT_ROWS)])
+            written += number
+            writer.writerow([])
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+        for i in range(PADDING_ROWS):
+            writer.writerow(['--'] * 4)
+    finally:
+        fh.close()
+
+
+def run_import(database, path, cold, incremental):
+    """
+    Import a spreadsheet in a new process, and return the command's
+    report as a dictionary.
+    """
+    report_path = os.path.join(os.path.dirname(database), 'report.json')
+    code = RUN_IMPORT % {'database': database, 'url': 'file://' + path,
+        'cold': cold, 'report': report_path, 'incremental': incremental}
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([entry or os.getcwd()
+        for entry in sys.path])
+    process = subprocess.Popen([sys.executable, '-c', code], env=env)
+    process.communicate()
+    if process.returncode:
+        raise RuntimeError('Import process failed.')
+    fh = open(report_path)
+    try:
+        return json.load(fh)
+    finally:
+        fh.close()
+
+
+def report(rows, run, result):
+    """Print the throughput of an import."""
+    print '%8d rows  %-4s %8.0f rows/s  %6.2f queries/row  %7.1fMB peak' % (
+        rows, run, rows / max(result['duration'], 0.001),
+        float(result['queries']) / rows, result['peak_memory'] / 1024.0)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--sizes', default='1000,10000,100000',
+        help='Comma-separated numbers of gigs in the spreadsheets.')
+    parser.add_option('--seed', type='int', default=0,
+        help='Seed for the random spreadsheet contents.')
+    parser.add_option('-i', '--incremental', action='store_true',
+        default=False, help='Run incremental imports.')
+    options, args = parser.parse_args()
+    if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+        parser.error('DJANGO_SETTINGS_MODULE must be set.')
+    directory = tempfile.mkdtemp()
+    try:
+        for rows in [int(size) for size in options.sizes.split(',')]:
+            path = os.path.join(directory, 'gigs-%d.csv' % rows)
+            database = os.path.join(directory, 'gigs-%d.sqlite' % rows)
+            generate_spreadsheet(path, rows, options.seed)
+            report(rows, 'cold', run_import(database, path, True,
+                options.incremental))
+            report(rows, 'warm', run_import(database, path, False,
+                options.incremental))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
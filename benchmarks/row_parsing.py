@@ -0,0 +1,83 @@
+"""
+Measure how quickly the rows of the Ripping Records spreadsheet are parsed
+into ``RippedGig`` objects, with and without the ``CellParser`` caches.
+Parsing with the caches turned off does the same work for every row that
+the import did before the caches were added.
+
+Run it from your project directory with your settings module set, e.g.::
+
+    DJANGO_SETTINGS_MODULE=settings python gigs/benchmarks/row_parsing.py
+
+Only parsing is timed: the spreadsheet is generated and read into memory
+first, and nothing is saved to the database.
+"""
+import csv
+import datetime
+import logging
+from optparse import OptionParser
+import os
+import tempfile
+import time
+
+from import_throughput import generate_spreadsheet
+
+
+def parse(rows, parser):
+    """Parse every gig row into a ``RippedGig``, returning how many."""
+    from gigs.management.commands.import_gigs_from_ripping_records import \
+        RippedGig, dated_rows
+    logger = logging.getLogger('gigs.benchmarks')
+    number = 0
+    for row, year, month in dated_rows(rows, logger):
+        RippedGig(row[1], row[2], datetime.date(year, month,
+            parser.day(row[0])), row[3], None, parser)
+        number += 1
+    return number
+
+
+def best_time(rows, cached, repeat):
+    """
+    Return the fastest of ``repeat`` timings of parsing the rows with a
+    new ``CellParser``, with or without its caches.
+    """
+    from gigs.management.commands.import_gigs_from_ripping_records import \
+        CellParser, MAX_CACHED_CELLS
+    max_size = cached and MAX_CACHED_CELLS or 0
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        parse(rows, CellParser(max_size))
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--rows', type='int', default=100000,
+        help='Number of gigs in the spreadsheet.')
+    parser.add_option('-r', '--repeat', type='int', default=5,
+        help='Number of times to time each parser.')
+    options, args = parser.parse_args()
+    if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+        parser.error('DJANGO_SETTINGS_MODULE must be set.')
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        generate_spreadsheet(path, options.rows)
+        fh = open(path, 'rb')
+        try:
+            rows = list(csv.reader(fh))
+        finally:
+            fh.close()
+    finally:
+        os.remove(path)
+    uncached = best_time(rows, False, options.repeat)
+    cached = best_time(rows, True, options.repeat)
+    for name, seconds in (('uncached', uncached), ('cached', cached)):
+        print '%-10s %8.3fs  %8.0f rows/s' % (name, seconds,
+            options.rows / seconds)
+    print 'speed-up   %8.2fx' % (uncached / cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure how long a new process takes to import ``gigs.models`` and to
+serve its first request, as a new web worker would.
+
+Run it from your project directory with your settings module set, e.g.::
+
+    DJANGO_SETTINGS_MODULE=settings python gigs/benchmarks/startup.py
+
+Each measurement is taken in a fresh Python process, and the fastest and
+median times are reported.
+"""
+from optparse import OptionParser
+import os
+import subprocess
+import sys
+
+
+IMPORT_MODELS = """
+import time
+start = time.time()
+import gigs.models
+print time.time() - start
+"""
+
+FIRST_REQUEST = """
+import time
+start = time.time()
+from django.core.handlers.wsgi import WSGIHandler
+from StringIO import StringIO
+environ = {
+    'REQUEST_METHOD': 'GET',
+    'PATH_INFO': %(path)r,
+    'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': 'http',
+    'wsgi.input': StringIO(''),
+    'wsgi.errors': StringIO(),
+    'wsgi.multithread': False,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+}
+status = []
+def start_response(response_status, headers, exc_info=None):
+    status.append(response_status)
+''.join(WSGIHandler()(environ, start_response))
+print time.time() - start
+"""
+
+
+def time_in_new_process(code):
+    """Run Python code in a new process and return the time it printed."""
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([path or os.getcwd()
+        for path in sys.path])
+    process = subprocess.Popen([sys.executable, '-c', code],
+        stdout=subprocess.PIPE, env=env)
+    output = process.communicate()[0]
+    if process.returncode:
+        raise RuntimeError('Benchmark process failed.')
+    return float(output.strip().splitlines()[-1])
+
+
+def report(name, code, repeat):
+    """Print the fastest and median of ``repeat`` timings of some code."""
+    timings = [time_in_new_process(code) for i in range(repeat)]
+    timings.sort()
+    print '%-24s fastest %7.1fms  median %7.1fms' % (name,
+        timings[0] * 1000, timings[len(timings) // 2] * 1000)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-n', '--repeat', type='int', default=10,
+        help='Number of processes to time for each measurement.')
+    parser.add_option('-p', '--path', default='/',
+        help='Path of the page to request.')
+    options, args = parser.parse_args()
+    if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+        parser.error('DJANGO_SETTINGS_MODULE must be set.')
+    report('import gigs.models', IMPORT_MODELS, options.repeat)
+    report('first request %s' % options.path,
+        FIRST_REQUEST % {'path': options.path}, options.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+from django.db import connection, models, transaction
+
+
+# Number of rows sent to the database in a single statement.  This keeps
+# ``IN`` clauses under SQLite's limit of 999 bound parameters.
+CHUNK_SIZE = 500
+
+
+def chunks(sequence, size=CHUNK_SIZE):
+    """
+    Yield successive lists of at most ``size`` items from a sequence or
+    iterator.  Only one list is held in memory at a time.
+    """
+    chunk = []
+    for item in sequence:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def filter_in(queryset, field_name, values, size=CHUNK_SIZE):
+    """
+    Return a list of every object in ``queryset`` where ``field_name`` is
+    one of ``values``.  The ``IN`` query is split into chunks so it can be
+    used with any number of values.
+    """
+    results = []
+    lookup = '%s__in' % field_name
+    for chunk in chunks(set(values), size):
+        results.extend(queryset.filter(**{lookup: chunk}))
+    return results
+
+
+def bulk_insert(objects, size=CHUNK_SIZE):
+    """
+    Insert a list of unsaved model objects, all of the same model, using
+    one ``INSERT`` statement per chunk of objects.
+
+    Unlike ``save()`` no signals are sent and primary keys aren't set on
+    the objects, so this is only suitable for rows whose ids aren't needed
+    immediately.
+    """
+    objects = list(objects)
+    if not objects:
+        return 0
+    opts = objects[0]._meta
+    fields = [f for f in opts.local_fields if not isinstance(f,
+        models.AutoField)]
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(opts.db_table),
+        ', '.join([qn(f.column) for f in fields]),
+        ', '.join(['%s'] * len(fields)))
+    cursor = connection.cursor()
+    for chunk in chunks(objects, size):
+        cursor.executemany(sql, [[f.get_db_prep_save(f.pre_save(obj, True))
+            for f in fields] for obj in chunk])
+    transaction.commit_unless_managed()
+    return len(objects)
+
+
+def m2m_table(model, field_name):
+    """
+    Return the table name and the two column names of the join table
+    behind a many-to-many field, as a tuple.
+    """
+    field = model._meta.get_field(field_name)
+    return (field.m2m_db_table(), field.m2m_column_name(),
+        field.m2m_reverse_name())
+
+
+def m2m_pairs(model, field_name, ids=None, source_ids=None):
+    """
+    Return a set of ``(source_id, target_id)`` tuples for every row in the
+    join table behind a many-to-many field.  If ``ids`` is given only rows
+    where the target id is in ``ids`` are returned; if ``source_ids`` is
+    given only rows where the source id is in ``source_ids`` are.
+    """
+    table, source, target = m2m_table(model, field_name)
+    qn = connection.ops.quote_name
+    sql = 'SELECT %s, %s FROM %s' % (qn(source), qn(target), qn(table))
+    cursor = connection.cursor()
+    pairs = set()
+    if ids is not None:
+        column = target
+    elif source_ids is not None:
+        column, ids = source, source_ids
+    else:
+        cursor.execute(sql)
+        pairs.update(tuple(row) for row in cursor.fetchall())
+        return pairs
+    for chunk in chunks(set(ids)):
+        cursor.execute('%s WHERE %s IN (%s)' % (sql, qn(column),
+            ', '.join(['%s'] * len(chunk))), chunk)
+        pairs.update(tuple(row) for row in cursor.fetchall())
+    return pairs
+
+
+def bulk_add_m2m(model, field_name, pairs, size=CHUNK_SIZE):
+    """
+    Insert ``(source_id, target_id)`` rows into the join table behind a
+    many-to-many field.  The caller is responsible for making sure the
+    rows don't already exist.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return 0
+    table, source, target = m2m_table(model, field_name)
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (qn(table),
+        qn(source), qn(target))
+    cursor = connection.cursor()
+    for chunk in chunks(pairs, size):
+        cursor.executemany(sql, chunk)
+    transaction.commit_unless_managed()
+    return len(pairs)
+
+
+def bulk_remove_m2m(model, field_name, pairs, size=CHUNK_SIZE):
+    """
+    Delete ``(source_id, target_id)`` rows from the join table behind a
+    many-to-many field.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return 0
+    table, source, target = m2m_table(model, field_name)
+    qn = connection.ops.quote_name
+    sql = 'DELETE FROM %s WHERE %s = %%s AND %s = %%s' % (qn(table),
+        qn(source), qn(target))
+    cursor = connection.cursor()
+    for chunk in chunks(pairs, size):
+        cursor.executemany(sql, chunk)
+    transaction.commit_unless_managed()
+    return len(pairs)
@@ -0,0 +1,219 @@
+import httplib
+import socket
+import threading
+import urllib2
+
+
+# Number of idle connections kept open to each host.
+DEFAULT_MAX_IDLE = 4
+# Errors raised when a request is sent on a connection the server has
+# already closed.  The request is then sent again on a new connection.
+STALE_CONNECTION_ERRORS = (socket.error, httplib.BadStatusLine,
+    httplib.CannotSendRequest, httplib.ResponseNotReady)
+# Number of bytes read at a time when a response is read line by line.
+READLINE_BLOCK_SIZE = 8 * 1024
+
+
+class ConnectionPool(object):
+
+    """
+    A thread-safe pool of persistent HTTP connections, kept per scheme and
+    host, so requests to the same provider don't each pay for a new TCP
+    (and TLS) connection.
+    """
+
+    def __init__(self, max_idle=DEFAULT_MAX_IDLE):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return an idle connection for the key, a ``(connection class,
+        host)`` tuple, or ``None`` if there isn't one.
+        """
+        self.lock.acquire()
+        try:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop()
+            return None
+        finally:
+            self.lock.release()
+
+    def put(self, key, connection):
+        """Return a connection whose response has been read to the pool."""
+        self.lock.acquire()
+        try:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        finally:
+            self.lock.release()
+        connection.close()
+
+    def close(self):
+        """Close every idle connection."""
+        self.lock.acquire()
+        try:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+        finally:
+            self.lock.release()
+
+
+class PooledResponse(object):
+
+    """
+    A response to a request made on a pooled connection.  It has the same
+    interface as the responses returned by ``urllib2.urlopen()``.  Once
+    the response body has been read the connection is returned to the
+    pool; if the response is closed before then the connection is closed
+    too.
+    """
+
+    def __init__(self, pool, key, connection, response, url):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.code = response.status
+        self.msg = response.reason
+        self.buffer = ''
+        if response.length == 0:
+            # No body (e.g. 304 Not Modified), so the connection is free.
+            response.read()
+        self._release()
+
+    def _release(self):
+        if self.connection is not None and self.response.isclosed():
+            if self.response.will_close:
+                self.connection.close()
+            else:
+                self.pool.put(self.key, self.connection)
+            self.connection = None
+
+    def read(self, amt=None):
+        buffered, self.buffer = self.buffer, ''
+        if amt is None:
+            data = buffered + self.response.read()
+        elif len(buffered) >= amt:
+            data, self.buffer = buffered[:amt], buffered[amt:]
+        else:
+            data = buffered + self.response.read(amt - len(buffered))
+        self._release()
+        return data
+
+    def readline(self, limit=-1):
+        # The response is read a block at a time rather than from the
+        # socket directly, so the end of the body is respected.
+        while '\n' not in self.buffer and \
+                (limit < 0 or len(self.buffer) < limit):
+            data = self.response.read(READLINE_BLOCK_SIZE)
+            if not data:
+                break
+            self.buffer += data
+        end = self.buffer.find('\n') + 1 or len(self.buffer)
+        if limit >= 0:
+            end = min(end, limit)
+        line, self.buffer = self.buffer[:end], self.buffer[end:]
+        self._release()
+        return line
+
+    def readlines(self, sizehint=0):
+        return self.read().splitlines(True)
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.response.close()
+
+    def info(self):
+        return self.response.msg
+
+    def geturl(self):
+        return self.url
+
+
+class KeepAliveHandler(urllib2.HTTPHandler, urllib2.HTTPSHandler):
+
+    """
+    A ``urllib2`` handler for HTTP and HTTPS URLs that reuses connections
+    from a ``ConnectionPool`` rather than opening a new connection for
+    each request.
+    """
+
+    def __init__(self, pool):
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, request):
+        return self._open(httplib.HTTPConnection, request)
+
+    def https_open(self, request):
+        return self._open(httplib.HTTPSConnection, request)
+
+    def _open(self, connection_class, request):
+        host = request.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        key = (connection_class, host)
+        headers = dict(request.headers)
+        headers.update(request.unredirected_hdrs)
+        headers = dict([(name.title(), value)
+            for name, value in headers.items()])
+        connection = self.pool.get(key)
+        if connection is not None:
+            try:
+                return self._request(key, connection, request, headers)
+            except STALE_CONNECTION_ERRORS:
+                # The server closed the idle connection, so try again on a
+                # new one.
+                connection.close()
+        try:
+            return self._request(key, connection_class(host), request,
+                headers)
+        except (socket.error, httplib.HTTPException), e:
+            raise urllib2.URLError(e)
+
+    def _request(self, key, connection, request, headers):
+        try:
+            connection.request(request.get_method(), request.get_selector(),
+                request.data, headers)
+            response = connection.getresponse()
+        except:
+            connection.close()
+            raise
+        return PooledResponse(self.pool, key, connection, response,
+            request.get_full_url())
+
+
+_pool = ConnectionPool()
+
+
+def build_opener(*handlers):
+    """
+    Return a new ``urllib2`` opener, with any extra handlers given, that
+    uses connections from the pool shared by the whole process.  This is
+    for libraries that add their own handlers to the opener they're given.
+    """
+    return urllib2.build_opener(KeepAliveHandler(_pool), *handlers)
+
+
+_opener = build_opener()
+
+
+def urlopen(request):
+    """
+    Open a URL or ``urllib2.Request``, like ``urllib2.urlopen()``, using
+    a connection from the pool shared by the whole process.
+    """
+    return _opener.open(request)
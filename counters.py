@@ -0,0 +1,135 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from gigs.bulk import chunks
+from gigs.models import Gig, Artist, Venue, Town, Promoter, SyncState
+
+
+# Each model with a ``number_of_upcoming_gigs`` field, along with the
+# lookup from a ``Gig`` to the model.
+UPCOMING_GIG_COUNTERS = (
+    (Artist, 'artist'),
+    (Venue, 'venue'),
+    (Town, 'venue__town'),
+    (Promoter, 'promoter'),
+)
+# The ``SyncState`` used to record the date the counters were last correct.
+ROLLOVER_PROVIDER = 'gigs'
+ROLLOVER_COMMAND = 'rollover_upcoming_gigs'
+
+
+def count_upcoming_gigs(lookup, gigs=None):
+    """
+    Return a dictionary mapping object ids to their number of upcoming
+    gigs, using one ``GROUP BY`` query.  ``lookup`` is the path from a
+    ``Gig`` to the object, e.g. ``'venue__town'``.  Objects without any
+    upcoming gigs aren't included.
+
+    A different queryset of gigs to count can be given in ``gigs``.
+    """
+    if gigs is None:
+        gigs = Gig.objects.upcoming()
+    # The default ordering has to be cleared or it would be included in the
+    # GROUP BY clause.
+    rows = gigs.values(lookup).annotate(number=Count('id')).order_by()
+    return dict((row[lookup], row['number']) for row in rows
+        if row[lookup] is not None)
+
+
+def update_counters(model, changes):
+    """
+    Write changed ``number_of_upcoming_gigs`` values to the database,
+    where ``changes`` is a dictionary mapping object ids to their new
+    value.  Objects with the same value are updated together, bypassing
+    ``save()``.
+    """
+    ids_by_number = {}
+    for pk, number in changes.items():
+        ids_by_number.setdefault(number, []).append(pk)
+    for number, ids in ids_by_number.items():
+        for chunk in chunks(ids):
+            model.objects.filter(id__in=chunk).update(
+                number_of_upcoming_gigs=number)
+
+
+def get_rollover_state():
+    """
+    Return the ``SyncState`` holding the date the counters were last
+    brought up-to-date.
+    """
+    return SyncState.objects.get_state(ROLLOVER_PROVIDER, ROLLOVER_COMMAND)
+
+
+def set_rollover_date(date):
+    """Record the date the counters were last brought up-to-date."""
+    state = get_rollover_state()
+    state.high_water = datetime.datetime.combine(date, datetime.time())
+    state.save()
+
+
+@transaction.commit_on_success
+def recount_upcoming_gigs():
+    """
+    Make sure the ``number_of_upcoming_gigs`` field of every artist,
+    venue, town, and promoter is correct.  Only objects whose number has
+    changed are updated.  Returns a list of ``(model, number_updated)``
+    tuples.
+    """
+    updated = []
+    for model, lookup in UPCOMING_GIG_COUNTERS:
+        counts = count_upcoming_gigs(lookup)
+        changes = {}
+        for pk, number in model.objects.values_list('id',
+                'number_of_upcoming_gigs'):
+            if counts.get(pk, 0) != number:
+                changes[pk] = counts.get(pk, 0)
+        update_counters(model, changes)
+        updated.append((model, len(changes)))
+    # The counters are now correct as of today, so tonight's rollover
+    # needn't touch today's gigs.
+    set_rollover_date(datetime.date.today())
+    return updated
+
+
+@transaction.commit_on_success
+def rollover_upcoming_gigs(today=None):
+    """
+    Decrement the ``number_of_upcoming_gigs`` field of every artist,
+    venue, town, and promoter with gigs that have taken place since the
+    counters were last brought up-to-date.  Only those gigs are counted,
+    so this is much cheaper than a full recount.  If the counters have
+    never been brought up-to-date a full recount is done instead.
+
+    Returns a list of ``(model, number_updated)`` tuples.
+    """
+    if today is None:
+        today = datetime.date.today()
+    state = get_rollover_state()
+    if state.high_water is None:
+        return recount_upcoming_gigs()
+    last_rollover = state.high_water.date()
+    updated = []
+    if last_rollover < today:
+        past_gigs = Gig.objects.published(date__gte=last_rollover,
+            date__lt=today)
+        for model, lookup in UPCOMING_GIG_COUNTERS:
+            counts = count_upcoming_gigs(lookup, past_gigs)
+            ids_by_number = {}
+            for pk, number in counts.items():
+                ids_by_number.setdefault(number, []).append(pk)
+            for number, ids in ids_by_number.items():
+                for chunk in chunks(ids):
+                    objects = model.objects.filter(id__in=chunk)
+                    # The counter can't go below zero.  This has to be done
+                    # before the decrement, or counters decremented below
+                    # ``number`` would be zeroed too.
+                    objects.filter(number_of_upcoming_gigs__lt=number).update(
+                        number_of_upcoming_gigs=0)
+                    objects.filter(number_of_upcoming_gigs__gte=number).update(
+                        number_of_upcoming_gigs=F('number_of_upcoming_gigs') -
+                        number)
+            updated.append((model, len(counts)))
+        set_rollover_date(today)
+    return updated
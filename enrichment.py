@@ -0,0 +1,207 @@
+import httplib
+import logging
+import Queue
+import random
+import socket
+import threading
+import time
+import urllib2
+
+from django.conf import settings
+from django.db import connection
+
+
+# The maximum number of simultaneous requests and the maximum number of
+# requests per second made to each provider.  These can be overridden
+# with the ``GIGS_PROVIDER_LIMITS`` setting, e.g.
+# ``{'lastfm': {'concurrency': 2, 'rate': 1}}``.  A rate of ``None`` means
+# requests aren't rate-limited.
+DEFAULT_PROVIDER_LIMITS = {
+    'lastfm': {'concurrency': 4, 'rate': 5},
+    'musicbrainz': {'concurrency': 1, 'rate': 1},
+    'images': {'concurrency': 4, 'rate': 10},
+    'guardian': {'concurrency': 4, 'rate': 10},
+}
+# Number of worker threads used by ``EnrichmentRunner`` by default.
+DEFAULT_WORKERS = 4
+# Errors raised by a request that may succeed if it's retried.
+TRANSIENT_ERRORS = (urllib2.URLError, httplib.HTTPException, socket.error)
+# HTTP status codes of responses that may succeed if they're retried:
+# server errors, plus the codes used when a rate limit is exceeded.
+RETRY_STATUS_CODES = (403, 408, 429)
+
+
+class TokenBucket(object):
+
+    """
+    A thread-safe token bucket, used to limit the rate at which requests
+    are made.  Tokens are added at ``rate`` tokens per second, up to
+    ``capacity`` tokens, and each request takes one token.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self):
+        """Wait until a token is available, then take it."""
+        while True:
+            self.lock.acquire()
+            try:
+                now = time.time()
+                self.tokens = min(self.capacity,
+                    self.tokens + (now - self.timestamp) * self.rate)
+                self.timestamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            finally:
+                self.lock.release()
+            time.sleep(wait)
+
+
+class ProviderLimit(object):
+
+    """
+    Limits both the number of simultaneous requests made to a provider
+    and the rate at which they're made.
+    """
+
+    def __init__(self, concurrency, rate=None):
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+        if rate:
+            self.bucket = TokenBucket(rate)
+        else:
+            self.bucket = None
+
+    def call(self, function, *args, **kwargs):
+        """Call ``function`` once the limits allow, returning its result."""
+        self.semaphore.acquire()
+        try:
+            if self.bucket is not None:
+                self.bucket.consume()
+            return function(*args, **kwargs)
+        finally:
+            self.semaphore.release()
+
+
+_provider_limits = {}
+_provider_limits_lock = threading.Lock()
+
+
+def get_provider_limit(provider):
+    """
+    Return the ``ProviderLimit`` for the named provider, creating it from
+    the project's settings the first time it's needed.
+    """
+    _provider_limits_lock.acquire()
+    try:
+        if provider not in _provider_limits:
+            limits = DEFAULT_PROVIDER_LIMITS.get(provider,
+                {'concurrency': DEFAULT_WORKERS, 'rate': None}).copy()
+            limits.update(getattr(settings, 'GIGS_PROVIDER_LIMITS',
+                {}).get(provider, {}))
+            _provider_limits[provider] = ProviderLimit(limits['concurrency'],
+                limits['rate'])
+        return _provider_limits[provider]
+    finally:
+        _provider_limits_lock.release()
+
+
+def limited(provider, function, *args, **kwargs):
+    """
+    Call ``function`` within the limits set for the named provider,
+    returning its result.  This should wrap every call that makes a
+    request to an external API.
+    """
+    return get_provider_limit(provider).call(function, *args, **kwargs)
+
+
+def retry(function, args=(), kwargs=None, attempts=5, base_delay=1,
+    max_delay=60):
+    """
+    Call ``function`` with the given arguments, returning its result.  If
+    it fails with a transient error it's called again after a delay, up to
+    ``attempts`` times in total, before the error is re-raised.
+
+    The delay doubles after each attempt, starting at ``base_delay``
+    seconds and capped at ``max_delay``, with random jitter added so
+    workers that fail together don't retry together.
+    """
+    logger = logging.getLogger('RippedRecordsLogger')
+    attempt = 1
+    while True:
+        try:
+            return function(*args, **(kwargs or {}))
+        except TRANSIENT_ERRORS, e:
+            code = getattr(e, 'code', None)
+            if code is not None and code < 500 and \
+                    code not in RETRY_STATUS_CODES:
+                raise
+            if attempt >= attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.5)
+            logger.warning('Request failed (%s); retrying in %.1f seconds.' %
+                (e, delay))
+            time.sleep(delay)
+            attempt += 1
+
+
+class EnrichmentRunner(object):
+
+    """
+    Runs tasks -- usually fetching an artist's or album's metadata -- using
+    a pool of worker threads.  Every request made to an external API is
+    subject to its provider's limits, so the rate at which the tasks are
+    completed is bounded by those limits rather than by the number of
+    workers.
+    """
+
+    def __init__(self, workers=None, logger=None):
+        if workers is None:
+            workers = getattr(settings, 'GIGS_ENRICHMENT_WORKERS',
+                DEFAULT_WORKERS)
+        self.workers = max(1, workers)
+        self.logger = logger or logging.getLogger('RippedRecordsLogger')
+
+    def run(self, tasks):
+        """
+        Call each of the tasks, which are callables taking no arguments,
+        returning once they have all finished.  Returns a list of the tasks'
+        return values, in the same order as the tasks; if a task raises an
+        exception its return value is ``None``.
+        """
+        queue = Queue.Queue()
+        results = []
+        for index, task in enumerate(tasks):
+            queue.put((index, task))
+            results.append(None)
+        threads = [threading.Thread(target=self._work, args=(queue, results))
+            for i in range(min(self.workers, len(results)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _work(self, queue, results):
+        """Run tasks from the queue until it's empty."""
+        try:
+            while True:
+                try:
+                    index, task = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    results[index] = task()
+                except Exception:
+                    self.logger.exception('Enrichment task failed.')
+        finally:
+            # Each thread has its own database connection, which would
+            # otherwise be left open.
+            connection.close()
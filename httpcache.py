@@ -0,0 +1,258 @@
+import cPickle as pickle
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import urllib2
+
+from django.conf import settings
+
+from gigs.connections import urlopen
+from gigs.enrichment import limited
+
+
+# Default maximum size of the cache on disk, in bytes.
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+# Number of seconds a response is considered fresh if the provider
+# doesn't say otherwise.  These can be overridden with the
+# ``GIGS_HTTP_CACHE_TTLS`` setting.
+DEFAULT_TTLS = {
+    'lastfm': 7 * 24 * 60 * 60,
+    'musicbrainz': 7 * 24 * 60 * 60,
+    'guardian': 60 * 60,
+}
+DEFAULT_TTL = 24 * 60 * 60
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class HTTPCache(object):
+
+    """
+    A persistent cache of responses from external APIs, stored on disk.
+
+    Each entry is stored in its own file, named after a hash of the key
+    (usually the URL).  An entry is fresh until its time-to-live has
+    passed; after that ``fetch()`` revalidates it using the ``ETag`` and
+    ``Last-Modified`` headers the provider sent, if any.  When the cache
+    grows beyond ``max_size`` bytes the least recently used entries are
+    removed.
+
+    Within a call to ``refresh()`` every entry is treated as stale, so a
+    lookup is made again rather than answered from the cache.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _path(self, key):
+        digest = hashlib.sha1(key).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get_entry(self, key):
+        """
+        Return the cache entry, a dictionary, stored under a key, or
+        ``None`` if there isn't one.  Reading an entry marks it as recently
+        used.
+        """
+        path = self._path(key)
+        try:
+            fh = open(path, 'rb')
+            try:
+                entry = pickle.load(fh)
+            finally:
+                fh.close()
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('key') != key:
+            return None
+        return entry
+
+    def set_entry(self, key, entry):
+        """Store a cache entry, a dictionary, under a key."""
+        entry['key'] = key
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass  # Another thread created it.
+        # Write to a temporary file first so readers never see half an
+        # entry.
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        fh = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump(entry, fh, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fh.close()
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.rename(temp_path, path)
+        self._grow(os.path.getsize(path) - old_size)
+
+    def _is_fresh(self, entry, now):
+        return entry is not None and entry['expires'] > now and \
+            not getattr(self.local, 'refreshing', False)
+
+    def refresh(self, func, *args, **kwargs):
+        """
+        Call a function with every entry treated as stale, in this thread
+        only, and return its result.  Any responses it fetches replace the
+        entries in the cache.
+        """
+        refreshing = getattr(self.local, 'refreshing', False)
+        self.local.refreshing = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.local.refreshing = refreshing
+
+    def get(self, key):
+        """Return the fresh value stored under a key, or ``None``."""
+        entry = self.get_entry(key)
+        if self._is_fresh(entry, time.time()):
+            return entry['body']
+        return None
+
+    def set(self, key, value, ttl=DEFAULT_TTL):
+        """Store a value under a key for ``ttl`` seconds."""
+        self.set_entry(key, {'body': value, 'expires': time.time() + ttl})
+
+    def fetch(self, url, provider=None, ttl=None, headers=None):
+        """
+        Return the body of the response to a GET request for a URL, from
+        the cache if possible.  Stale entries are revalidated with a
+        conditional GET.  Requests are made within the limits set for
+        ``provider``.
+        """
+        if ttl is None:
+            ttl = get_ttl(provider)
+        entry = self.get_entry(url)
+        now = time.time()
+        if self._is_fresh(entry, now):
+            return entry['body']
+        request = urllib2.Request(url)
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        if entry is not None:
+            if entry.get('etag'):
+                request.add_header('If-None-Match', entry['etag'])
+            if entry.get('last_modified'):
+                request.add_header('If-Modified-Since', entry['last_modified'])
+        try:
+            response = limited(provider, urlopen, request)
+        except urllib2.HTTPError, e:
+            if e.code == 304 and entry is not None:
+                # Not modified, so the stale entry is fresh again.
+                entry['expires'] = now + max_age(e.info(), ttl)
+                self.set_entry(url, entry)
+                return entry['body']
+            raise
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        info = response.info()
+        if 'no-store' not in (info.getheader('Cache-Control') or ''):
+            self.set_entry(url, {
+                'body': body,
+                'etag': info.getheader('ETag'),
+                'last_modified': info.getheader('Last-Modified'),
+                'expires': now + max_age(info, ttl),
+            })
+        return body
+
+    def _grow(self, size):
+        """
+        Record that the cache has grown by ``size`` bytes, removing the
+        least recently used entries if it's now too big.
+        """
+        self.lock.acquire()
+        try:
+            if self.size is None:
+                self.size = sum([entry[2] for entry in self._entries()])
+            else:
+                self.size += size
+            if self.size > self.max_size:
+                self._evict()
+        finally:
+            self.lock.release()
+
+    def _entries(self):
+        """Return a list of ``(path, mtime, size)`` for every entry."""
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache is below
+        nine-tenths of its maximum size.
+        """
+        entries = self._entries()
+        entries.sort(key=lambda entry: entry[1])
+        self.size = sum([entry[2] for entry in entries])
+        for path, mtime, size in entries:
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+
+def max_age(info, default):
+    """
+    Return the number of seconds a response can be cached for, from its
+    ``Cache-Control`` header, or ``default`` if it doesn't say.
+    """
+    match = MAX_AGE_RE.search(info.getheader('Cache-Control') or '')
+    if match:
+        return int(match.group(1))
+    return default
+
+
+def get_ttl(provider):
+    """Return the default time-to-live for responses from a provider."""
+    ttls = DEFAULT_TTLS.copy()
+    ttls.update(getattr(settings, 'GIGS_HTTP_CACHE_TTLS', {}))
+    return ttls.get(provider, DEFAULT_TTL)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the ``HTTPCache`` shared by the whole process, stored in the
+    directory given by the ``GIGS_HTTP_CACHE_DIR`` setting.
+    """
+    global _cache
+    _cache_lock.acquire()
+    try:
+        if _cache is None:
+            directory = getattr(settings, 'GIGS_HTTP_CACHE_DIR',
+                os.path.join(tempfile.gettempdir(), 'gigs-http-cache'))
+            _cache = HTTPCache(directory, getattr(settings,
+                'GIGS_HTTP_CACHE_SIZE', DEFAULT_MAX_SIZE))
+        return _cache
+    finally:
+        _cache_lock.release()
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import tempfile
+import urllib2
+import urlparse
+
+from django.conf import settings
+
+from gigs.connections import urlopen
+from gigs.enrichment import limited
+from gigs.httpcache import get_cache
+
+
+# Images are read and written this many bytes at a time.
+CHUNK_SIZE = 64 * 1024
+# Default maximum size of a downloaded image, in bytes.  This can be
+# overridden with the ``GIGS_MAX_IMAGE_SIZE`` setting.
+DEFAULT_MAX_IMAGE_SIZE = 5 * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def get_max_image_size():
+    """Return the maximum size of a downloaded image, in bytes."""
+    return getattr(settings, 'GIGS_MAX_IMAGE_SIZE', DEFAULT_MAX_IMAGE_SIZE)
+
+
+def get_extension(url):
+    """Return the file extension for the image at a URL."""
+    extension = os.path.splitext(urlparse.urlparse(url)[2])[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return extension
+    return '.jpg'
+
+
+def fetch_image(url, upload_to, skip_unchanged=True):
+    """
+    Download the image at a URL into the ``upload_to`` directory (relative
+    to ``MEDIA_ROOT``), returning the path of the stored image relative to
+    ``MEDIA_ROOT``.
+
+    The image is streamed to a temporary file a chunk at a time and named
+    after a hash of its contents, so identical images -- Last.fm's
+    placeholder, for example -- are only stored once.  ``ImageTooLarge``
+    is raised if the image is bigger than the ``GIGS_MAX_IMAGE_SIZE``
+    setting.
+
+    If ``skip_unchanged`` is ``True`` and the image was downloaded before,
+    the previous download is reused without reading the response body if
+    the remote ``ETag`` or size hasn't changed.
+    """
+    cache = get_cache()
+    key = 'image:%s:%s' % (upload_to, url)
+    entry = cache.get_entry(key)
+    if entry is not None and not os.path.exists(os.path.join(
+            settings.MEDIA_ROOT, entry['name'])):
+        entry = None
+    if not skip_unchanged:
+        entry = None
+    request = urllib2.Request(url)
+    if entry is not None and entry.get('etag'):
+        request.add_header('If-None-Match', entry['etag'])
+    try:
+        response = limited('images', urlopen, request)
+    except urllib2.HTTPError, e:
+        if e.code == 304 and entry is not None:
+            return entry['name']
+        raise
+    try:
+        info = response.info()
+        etag = info.getheader('ETag')
+        try:
+            length = int(info.getheader('Content-Length'))
+        except (TypeError, ValueError):
+            length = None
+        if entry is not None and length is not None and \
+                length == entry.get('length') and \
+                (etag is None or etag == entry.get('etag')):
+            return entry['name']
+        max_size = get_max_image_size()
+        if length is not None and length > max_size:
+            raise ImageTooLarge('%s is %d bytes.' % (url, length))
+        directory = os.path.join(settings.MEDIA_ROOT, upload_to)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write the image to a temporary file in the same directory, so it
+        # can be renamed into place once its hash is known.
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        fh = os.fdopen(fd, 'wb')
+        digest = hashlib.sha1()
+        size = 0
+        try:
+            try:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ImageTooLarge('%s is over %d bytes.' %
+                            (url, max_size))
+                    digest.update(chunk)
+                    fh.write(chunk)
+            finally:
+                fh.close()
+        except:
+            os.remove(temp_path)
+            raise
+    finally:
+        response.close()
+    name = os.path.join(upload_to, digest.hexdigest() + get_extension(url))
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    if os.path.exists(path):
+        # The same image is already stored.
+        os.remove(temp_path)
+    else:
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, path)
+    cache.set_entry(key, {'name': name, 'etag': etag, 'length': size,
+        'expires': 0})
+    return name
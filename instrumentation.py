@@ -0,0 +1,183 @@
+import datetime
+try:
+    import json
+except ImportError:
+    import simplejson as json
+import resource
+import time
+
+from django.db import connection
+
+from gigs.models import ImportRun
+
+
+class CountingCursor(object):
+
+    """
+    Wraps a database cursor, recording the number of queries run through
+    it, and the time they took, in a ``RunReport``.
+    """
+
+    def __init__(self, cursor, report):
+        self.cursor = cursor
+        self.report = report
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.report.add_query(time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.report.add_query(time.time() - start)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class RunReport(object):
+
+    """
+    Measures a run of a management command: the time spent in each phase
+    of the run, the number of database queries made in each phase and the
+    time they took, the process's peak memory use, and counts of the
+    objects created, updated, or skipped.
+
+    Phases can be nested, and time is only counted against the innermost
+    phase, so a phase's time doesn't include the phases run inside it.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.started = datetime.datetime.now()
+        self.start_time = self.last_time = time.time()
+        self.duration = None
+        self.peak_memory = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        # Phase name -> dictionary of measurements.
+        self.phases = {}
+        # Names of the phases running, innermost last.
+        self.stack = []
+        # Entity -> action -> count.
+        self.counters = {}
+        self.original_cursor = None
+
+    def _phase(self, name):
+        return self.phases.setdefault(name, {'seconds': 0.0, 'queries': 0,
+            'query_seconds': 0.0})
+
+    def _charge(self):
+        """Add the time since the last change of phase to the innermost."""
+        now = time.time()
+        if self.stack:
+            self._phase(self.stack[-1])['seconds'] += now - self.last_time
+        self.last_time = now
+
+    def start(self, name):
+        """Start a phase, which may be inside another."""
+        self._charge()
+        self.stack.append(name)
+
+    def stop(self):
+        """Stop the innermost phase."""
+        self._charge()
+        self.stack.pop()
+
+    def time(self, name, func, *args, **kwargs):
+        """Call a function, timing it as a phase, and return its result."""
+        self.start(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stop()
+
+    def iterate(self, name, iterable):
+        """
+        Yield the items from an iterable, timing how long each takes to
+        produce as a phase.  This is useful for generators, which do their
+        work lazily.
+        """
+        iterator = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = iterator.next()
+            finally:
+                self.stop()
+            yield item
+
+    def count(self, entity, action, number=1):
+        """Add to the count of an action (e.g. 'created') on an entity."""
+        actions = self.counters.setdefault(entity, {})
+        actions[action] = actions.get(action, 0) + number
+
+    def add_query(self, seconds):
+        """Record a database query, against the innermost phase."""
+        self.queries += 1
+        self.query_seconds += seconds
+        if self.stack:
+            phase = self._phase(self.stack[-1])
+            phase['queries'] += 1
+            phase['query_seconds'] += seconds
+
+    def install(self):
+        """Start counting the queries made on the database connection."""
+        self.original_cursor = original_cursor = connection.cursor
+        connection.cursor = lambda: CountingCursor(original_cursor(), self)
+
+    def uninstall(self):
+        """Stop counting queries."""
+        if self.original_cursor is not None:
+            del connection.cursor
+            self.original_cursor = None
+
+    def finish(self):
+        """Stop counting queries and record the run's duration."""
+        self.uninstall()
+        while self.stack:
+            self.stop()
+        self.duration = time.time() - self.start_time
+        # ``ru_maxrss`` is the peak resident set size of the process, in
+        # kilobytes on Linux, so it includes anything run before the
+        # command in the same process.
+        self.peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def as_dict(self):
+        """Return the report as a dictionary."""
+        phases = {}
+        for name, phase in self.phases.items():
+            phases[name] = {
+                'seconds': round(phase['seconds'], 4),
+                'queries': phase['queries'],
+                'query_seconds': round(phase['query_seconds'], 4),
+            }
+        return {
+            'command': self.command,
+            'started': self.started.isoformat(),
+            'duration': round(self.duration or 0, 4),
+            'queries': self.queries,
+            'query_seconds': round(self.query_seconds, 4),
+            'peak_memory': self.peak_memory,
+            'phases': phases,
+            'counters': self.counters,
+        }
+
+    def to_json(self):
+        """Return the report as a JSON string."""
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def save(self):
+        """Store the report as an ``ImportRun``, and return it."""
+        return ImportRun.objects.create(command=self.command,
+            started=self.started, duration=self.duration,
+            queries=self.queries, peak_memory=self.peak_memory,
+            report=self.to_json())
@@ -0,0 +1,42 @@
+import fcntl
+import os
+import tempfile
+
+from django.conf import settings
+
+
+class LockHeld(Exception):
+    pass
+
+
+class FileLock(object):
+
+    """
+    An exclusive lock, held by one process at a time, used to stop two
+    runs of the same job overlapping.  The lock is an advisory lock on a
+    file in the directory given by the ``GIGS_LOCK_DIR`` setting (the
+    system's temporary directory by default), so it's released by the
+    operating system if the process dies.
+    """
+
+    def __init__(self, name):
+        directory = getattr(settings, 'GIGS_LOCK_DIR', tempfile.gettempdir())
+        self.path = os.path.join(directory, 'gigs-%s.lock' % name)
+        self.fh = None
+
+    def acquire(self):
+        """Take the lock, raising ``LockHeld`` if another process has it."""
+        fh = open(self.path, 'a')
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            fh.close()
+            raise LockHeld(self.path)
+        self.fh = fh
+
+    def release(self):
+        """Release the lock."""
+        if self.fh is not None:
+            fcntl.flock(self.fh.fileno(), fcntl.LOCK_UN)
+            self.fh.close()
+            self.fh = None
@@ -0,0 +1,26 @@
+import logging
+import logging.config
+import threading
+
+
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+
+def get_logger():
+    """
+    Return the logger used by the management commands.  Logging is
+    configured from the ``logging.conf`` file in the current directory the
+    first time it's needed, so commands run one after another in the same
+    process (by the ``gigs_scheduler`` command, for example) don't
+    configure it again.
+    """
+    global _logging_configured
+    _logging_lock.acquire()
+    try:
+        if not _logging_configured:
+            logging.config.fileConfig("logging.conf")
+            _logging_configured = True
+    finally:
+        _logging_lock.release()
+    return logging.getLogger('RippedRecordsLogger')
@@ -0,0 +1,105 @@
+import datetime
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from gigs.bulk import bulk_insert, bulk_remove_m2m, chunks, filter_in,\
+    m2m_pairs
+from gigs.management import get_logger
+from gigs.models import ArchivedImportIdentifier, Gig, ImportIdentifier,\
+    identifier_digest
+
+
+# Identifiers of gigs that took place more than this many days ago are
+# archived.
+DEFAULT_MAX_AGE = 90
+# Number of gigs whose identifiers are archived in each transaction.
+BATCH_SIZE = 500
+
+
+def fill_digests(logger):
+    """
+    Set the digest of any identifiers stored before digests were added.
+    Returns the number of identifiers updated.
+    """
+    identifiers = list(ImportIdentifier.objects.filter(
+        digest='').values_list('id', 'identifier'))
+    for pk, identifier in identifiers:
+        ImportIdentifier.objects.filter(id=pk).update(
+            digest=identifier_digest(identifier))
+    if identifiers:
+        logger.info('Set the digest of %d identifiers.' % len(identifiers))
+    return len(identifiers)
+
+
+def archive_gig_identifiers(gig_ids, before):
+    """
+    Move the identifiers of the gigs with the given ids to the
+    ``ArchivedImportIdentifier`` table, unless they're also linked to a
+    gig on or after the date ``before``.  Returns the number of
+    identifiers archived.
+    """
+    pairs = m2m_pairs(Gig, 'import_identifiers', source_ids=gig_ids)
+    if not pairs:
+        return 0
+    # Keep any identifier that's still needed for a more recent gig.
+    all_pairs = m2m_pairs(Gig, 'import_identifiers',
+        [identifier_id for gig_id, identifier_id in pairs])
+    recent = set(filter_in(Gig.objects.filter(date__gte=before).values_list(
+        'id', flat=True), 'id', [gig_id for gig_id, identifier_id
+        in all_pairs if gig_id not in gig_ids]))
+    keep = set([identifier_id for gig_id, identifier_id in all_pairs
+        if gig_id in recent])
+    pairs = [(gig_id, identifier_id) for gig_id, identifier_id
+        in all_pairs if identifier_id not in keep]
+    identifiers = dict(filter_in(ImportIdentifier.objects.values_list('id',
+        'identifier'), 'id', [identifier_id for gig_id, identifier_id
+        in pairs]))
+    bulk_insert([ArchivedImportIdentifier(
+        identifier=identifiers[identifier_id],
+        type=ImportIdentifier.GIG_IMPORT_TYPE, object_id=gig_id)
+        for gig_id, identifier_id in pairs])
+    bulk_remove_m2m(Gig, 'import_identifiers', pairs)
+    for chunk in chunks(identifiers.keys()):
+        ImportIdentifier.objects.filter(id__in=chunk).delete()
+    return len(identifiers)
+
+
+class Command(NoArgsCommand):
+    help = "Archives the import identifiers of gigs that have taken place."
+    base_options = (
+        make_option('-d', '--days', type='int', default=DEFAULT_MAX_AGE,
+            help='Archive the identifiers of gigs that took place more than this many days ago (default: %d).' % DEFAULT_MAX_AGE),
+    )
+    option_list = NoArgsCommand.option_list + base_options
+
+    def handle_noargs(self, **options):
+        """
+        Keep the ``ImportIdentifier`` table small by moving the identifiers
+        of old gigs to the ``ArchivedImportIdentifier`` table.  A gig that
+        has taken place won't appear in the Ripping Records spreadsheet
+        again, so its identifier is no longer needed by the import.
+        """
+        logger = get_logger()
+        before = datetime.date.today() - datetime.timedelta(
+            days=options.get('days', DEFAULT_MAX_AGE))
+        logger.info('Archiving the identifiers of gigs before %s.' % before)
+        gig_ids = list(Gig.objects.filter(date__lt=before).values_list('id',
+            flat=True))
+        archived = 0
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            try:
+                fill_digests(logger)
+                transaction.commit()
+                for batch in chunks(gig_ids, BATCH_SIZE):
+                    archived += archive_gig_identifiers(set(batch), before)
+                    transaction.commit()
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            transaction.leave_transaction_management()
+        logger.info('Archived %d identifiers.' % archived)
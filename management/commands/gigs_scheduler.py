@@ -0,0 +1,117 @@
+from optparse import make_option
+import signal
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError, NoArgsCommand
+from django.db import connection, reset_queries, transaction
+
+from gigs.locks import FileLock, LockHeld
+from gigs.management import get_logger
+
+
+# How often, in seconds, each command is run, with the options it's run
+# with.  This can be overridden with the ``GIGS_SCHEDULE`` setting, which
+# maps command names to either an interval or an ``(interval, options)``
+# tuple.
+DEFAULT_SCHEDULE = {
+    'import_gigs_from_ripping_records': (60 * 60, {'incremental': True}),
+    'process_enrichment_jobs': 5 * 60,
+    'rollover_upcoming_gigs': 60 * 60,
+    'import_artist_reviews': 24 * 60 * 60,
+    'import_albums': 24 * 60 * 60,
+    'link_similar_artists': (24 * 60 * 60, {'stale_after': 7 * 24}),
+    'compact_import_identifiers': 7 * 24 * 60 * 60,
+}
+# Maximum number of seconds slept at a time, so a request to stop is
+# noticed promptly.
+MAX_SLEEP = 5
+
+
+def get_schedule():
+    """
+    Return a list of ``(command, interval, options)`` tuples for the
+    commands to be run.
+    """
+    schedule = []
+    for command, entry in getattr(settings, 'GIGS_SCHEDULE',
+            DEFAULT_SCHEDULE).items():
+        if isinstance(entry, (list, tuple)):
+            interval, options = entry
+        else:
+            interval, options = entry, {}
+        schedule.append((command, interval, options))
+    return schedule
+
+
+class Command(NoArgsCommand):
+    help = "Runs the import commands on a schedule in one long-running process."
+    base_options = (
+        make_option('--once', action='store_true', default=False,
+            help='Run each command once, then exit.'),
+    )
+    option_list = NoArgsCommand.option_list + base_options
+
+    def handle_noargs(self, **options):
+        """
+        Run the gigs, review, album, and similar artist imports, and the
+        enrichment queue, at the intervals given in the ``GIGS_SCHEDULE``
+        setting.
+
+        Running the commands in one process means Django, logging, the
+        database connection, and the connections and caches used for the
+        external APIs are set up once rather than by every cron job.  The
+        commands are run one at a time, and the scheduler holds a lock so a
+        second scheduler can't run them at the same time.
+        """
+        logger = get_logger()
+        lock = FileLock('gigs_scheduler')
+        try:
+            lock.acquire()
+        except LockHeld:
+            raise CommandError('The scheduler is already running.')
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        schedule = get_schedule()
+        next_runs = dict([(command, time.time())
+            for command, interval, command_options in schedule])
+        logger.info('Scheduler started.')
+        try:
+            while not self.stopping:
+                for command, interval, command_options in schedule:
+                    if self.stopping:
+                        break
+                    if next_runs[command] > time.time():
+                        continue
+                    started = time.time()
+                    self.run_command(command, command_options, logger)
+                    next_runs[command] = started + interval
+                if options.get('once'):
+                    break
+                time.sleep(max(0, min(MAX_SLEEP,
+                    min(next_runs.values()) - time.time())))
+        finally:
+            lock.release()
+        logger.info('Scheduler stopped.')
+
+    def stop(self, signum, frame):
+        """Signal handler; stop once the current command has finished."""
+        self.stopping = True
+
+    def run_command(self, command, options, logger):
+        """
+        Run a management command.  Errors are logged rather than raised so
+        one failing command doesn't stop the others.
+        """
+        logger.debug('Running %s.' % command)
+        try:
+            call_command(command, **options)
+        except Exception:
+            logger.exception('%s failed.' % command)
+            # Start the next command with a clean connection.
+            transaction.rollback_unless_managed()
+            connection.close()
+        # With DEBUG on, Django keeps every query run, which would grow
+        # without limit in a long-running process.
+        reset_queries()
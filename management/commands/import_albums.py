@@ -1,10 +1,17 @@
 import datetime
 from optparse import make_option
-import time
 
 from django.core.management.base import BaseCommand
 
-from gigs.models import Artist
+from gigs.enrichment import EnrichmentRunner
+from gigs.models import Artist, SyncState
+
+
+# Number of artists whose albums are imported between checkpoints.
+BATCH_SIZE = 50
+# The ``SyncState`` used to checkpoint an import.
+PROVIDER = 'musicbrainz'
+COMMAND = 'import_albums'
 
 
 class Command(BaseCommand):
@@ -12,19 +19,33 @@ class Command(BaseCommand):
     base_options = (
         make_option('-a', '--age', action='store', default=0, type='int',
             help='Import albums only for those artists created within this time period (in hours). Default is all artists.'),
+        make_option('-w', '--workers', action='store', default=None,
+            type='int', help='Number of artists to import albums for at once.'),
     )
     option_list = BaseCommand.option_list + base_options
 
     def handle(self, **options):
-        """Import all released albums for each artist in the database."""
-        artists = Artist.objects.published()
+        """
+        Import all released albums for each artist in the database.  The
+        id of the last artist completed is checkpointed as the command
+        goes, so if it's interrupted the next run carries on from there.
+        """
+        artists = Artist.objects.published().order_by('id')
         # Obey a maximum age for artists if set.
         age = options.get('age', None)
         earliest_date = datetime.datetime.now() - datetime.timedelta(hours=age)
         if age:
             artists = artists.filter(created__gte=earliest_date)
-        # Populate the artist's album set, pausing for one second after each
-        # artist so we don't pummel the MusicBrainz and Last.fm APIs.
-        for artist in artists:
-            artist.populate_album_set()
-            time.sleep(1)
+        state = SyncState.objects.get_state(PROVIDER, COMMAND)
+        if state.is_interrupted():
+            artists = artists.filter(id__gt=int(state.position))
+        artists = list(artists)
+        # Populate each artist's album set using a pool of workers.  The
+        # requests made to MusicBrainz and Last.fm are rate-limited so we
+        # don't pummel their APIs.
+        runner = EnrichmentRunner(options.get('workers'))
+        for start in range(0, len(artists), BATCH_SIZE):
+            batch = artists[start:start + BATCH_SIZE]
+            runner.run([artist.populate_album_set for artist in batch])
+            state.checkpoint(batch[-1].id)
+        state.finish()
@@ -1,17 +1,26 @@
 import datetime
+import functools
 from optparse import make_option
-import time
 
 from django.core.management.base import BaseCommand
 
+from gigs.enrichment import EnrichmentRunner
 from gigs.models import Artist
 
 
+def import_metadata(artist):
+    """Import the photo and biography for an artist."""
+    artist.get_photo()
+    artist.get_biography()
+
+
 class Command(BaseCommand):
     help = "Import metadata (photo and biography) for all artists."
     base_options = (
         make_option('-a', '--age', action='store', default=0, type='int',
             help='Import metadata only for those artists created within this time period (in hours). Default is all artists.'),
+        make_option('-w', '--workers', action='store', default=None,
+            type='int', help='Number of artists to import metadata for at once.'),
     )
     option_list = BaseCommand.option_list + base_options
 
@@ -28,9 +37,9 @@ class Command(BaseCommand):
         earliest_date = datetime.datetime.now() - datetime.timedelta(hours=age)
         if age:
             artists = artists.filter(created__gte=earliest_date)
-        # Loop through each artist, pausing for one second after each
-        # artist so we don't pummel the Last.fm API.
-        for artist in artists:
-            artist.get_photo()
-            artist.get_biography()
-            time.sleep(1)
+        # Import each artist's metadata using a pool of workers.  The
+        # requests made to Last.fm are rate-limited so we don't pummel the
+        # API.
+        runner = EnrichmentRunner(options.get('workers'))
+        runner.run([functools.partial(import_metadata, artist)
+            for artist in artists])
@@ -1,22 +1,33 @@
 # encoding: utf-8
 import datetime
-import logging
-import logging.config
+import functools
+from optparse import make_option
 try:
     import json
 except ImportError:
     import simplejson as json
 import urllib
-import urllib2
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from gigs.models import Artist, Review
+from gigs.bulk import bulk_insert, filter_in
+from gigs.enrichment import EnrichmentRunner, TRANSIENT_ERRORS, retry
+from gigs.httpcache import get_cache
+from gigs.management import get_logger
+from gigs.models import Artist, Review, SyncState
 
 
 __all__ = ("Command",)
 OPENPLATFORM_API_END_POINT = "http://content.guardianapis.com/search"
+# Number of times a page is requested before giving up on it.
+MAX_ATTEMPTS = 6
+# Number of pages retrieved by each worker before the reviews are saved.
+PAGES_PER_WORKER = 4
+# The ``SyncState`` records used to checkpoint the two parts of an import.
+PROVIDER = "guardian"
+REVIEWS_COMMAND = "import_artist_reviews"
+ARTIST_REVIEWS_COMMAND = "import_artist_reviews:artists"
 
 
 API_PARAMETERS = {
@@ -49,11 +60,12 @@ def api_url(page, from_date=None, **kwargs):
         urllib.urlencode(api_params))
 
 
-def save_review(review):
+def parse_review(review):
     """
-    Saves a Guardian review if there's a MusicBrainz id that matches an
-    artist in the database and the review has a rating out of five.
-    Returns ``True`` if the review was saved, ``False`` otherwise.
+    Convert a Guardian review, as returned by the API, into a tuple of
+    the MusicBrainz ids the review references and a dictionary of the
+    fields for a ``Review`` model.  Returns ``None`` if the review doesn't
+    have a rating out of five.
     """
     # Get the useful fields.  Note that not all these are mandatory.
     external_id = review.get("id")
@@ -65,7 +77,7 @@ def save_review(review):
         rating = review["fields"]["starRating"]
     except KeyError:
         # If there's no rating, ignore this review.
-        return False
+        return None
     # Remove the crud from the headline.
     if headline.endswith(u" – review") or headline.endswith(u" - review"):
         headline = headline[:-9]
@@ -85,115 +97,220 @@ def save_review(review):
         date = datetime.datetime.strptime(time, '%Y-%m-%dT%H:%M:%S') + tz
     else:
         date = datetime.datetime.strptime(time, '%Y-%m-%dT%H:%M:%SZ')
-    # Find the MusicBrainz id.
-    for reference in review["references"]:
-        if reference["type"] == "musicbrainz":
-            musicbrainz_id = reference["id"].rsplit("/", 1)[1]
-            try:
-                artist = Artist.objects.get(mbid=musicbrainz_id)
-                # Does this review exist in the database?
-                try:
-                    Review.objects.get(external_id=external_id)
-                except Review.DoesNotExist:
-                    review = Review(external_id=external_id,
-                        publication_date=date, headline=headline,
-                        trail=trail, byline=byline, url=url, artist=artist,
-                        rating=rating)
-                    review.save()
-                    return True
-            except Artist.DoesNotExist:
-                pass
-    return False
+    # Find the MusicBrainz ids.
+    musicbrainz_ids = [reference["id"].rsplit("/", 1)[1]
+        for reference in review["references"]
+        if reference["type"] == "musicbrainz"]
+    fields = {
+        "external_id": external_id,
+        "publication_date": date,
+        "headline": headline,
+        "trail": trail,
+        "byline": byline,
+        "url": url,
+        "rating": rating,
+    }
+    return musicbrainz_ids, fields
+
+
+def save_reviews(results):
+    """
+    Saves a page of Guardian reviews.  A review is saved if there's a
+    MusicBrainz id that matches an artist in the database, the review has
+    a rating out of five, and it isn't already in the database.  The
+    artists and existing reviews are looked up with one query each, and
+    the new reviews are saved in bulk.  Returns the number of reviews
+    saved.
+    """
+    reviews = [review for review in map(parse_review, results)
+        if review is not None]
+    musicbrainz_ids = set()
+    for review_ids, fields in reviews:
+        musicbrainz_ids.update(review_ids)
+    artist_ids = dict(filter_in(Artist.objects.values_list('mbid', 'id'),
+        'mbid', musicbrainz_ids))
+    external_ids = set(filter_in(Review.objects.values_list('external_id',
+        flat=True), 'external_id', [fields["external_id"]
+        for review_ids, fields in reviews]))
+    new_reviews = []
+    for review_ids, fields in reviews:
+        if fields["external_id"] in external_ids:
+            continue
+        # The review is for the first artist referenced who's in the
+        # database.
+        for musicbrainz_id in review_ids:
+            if musicbrainz_id in artist_ids:
+                new_reviews.append(Review(artist_id=artist_ids[
+                    musicbrainz_id], **fields))
+                external_ids.add(fields["external_id"])
+                break
+    return bulk_insert(new_reviews)
+
+
+def fetch_page(url):
+    """
+    Return the decoded JSON response from the Open Platform API for a URL,
+    retrying with an increasing delay if the request fails.  Returns
+    ``None`` if the page couldn't be retrieved.
+    """
+    try:
+        return json.loads(retry(get_cache().fetch, (url, 'guardian'),
+            attempts=MAX_ATTEMPTS))
+    except TRANSIENT_ERRORS:
+        return None
 
 
 class Command(BaseCommand):
     help = "Imports artist reviews from the Guardian."
+    base_options = (
+        make_option('-w', '--workers', action='store', default=None,
+            type='int', help='Number of pages to retrieve at once.'),
+    )
+    option_list = BaseCommand.option_list + base_options
 
     def handle(self, **options):
         """
         Import all Guardian reviews with ratings for each artist in the
         database.  The reviews are handled in two parts.  First, reviews
-        published after the most recent review in the database (or all
-        reviews if the database is empty) are retrieved from the
-        Guardian API.
-
-        Second, all reviews for artists created in the last two days are
-        retrieved.  This second stage is to allow older reviews for new
-        artists to be collected -- without it reviews for new artists
-        would only be stored that were written after they were created.
-
-        If it's not obvious from the wonderful description, this command
-        needs to be run at least once every two days to ensure all
-        reviews are discovered.
+        published since the last import (or all reviews if there hasn't
+        been one) are retrieved from the Guardian API.
+
+        Second, all reviews for artists created since the last import, or
+        in the last two days, are retrieved.  This second stage is to allow
+        older reviews for new artists to be collected -- without it reviews
+        for new artists would only be stored that were written after they
+        were created.
+
+        Both parts checkpoint their progress as they go, so if the command
+        is interrupted the next run carries on from the last page or artist
+        completed rather than starting again.
         """
         # Create the logger we'll use to store all the output.
-        logging.config.fileConfig("logging.conf")
-        logger = logging.getLogger('RippedRecordsLogger')
+        logger = get_logger()
         logger.info('Importing reviews from the Guardian.')
-        # Only look for reviews newer than the latest one in the database, if
-        # there is one.
-        try:
-            earliest_review_date = Review.objects.all()[0].publication_date
+        runner = EnrichmentRunner(options.get('workers'), logger)
+        # Old reviews for new artists are only needed if this isn't the
+        # first import.
+        if self.import_reviews(runner, logger):
+            self.import_artist_reviews(runner, logger)
+
+    def import_reviews(self, runner, logger):
+        """
+        Import reviews published since the last import.  The position
+        checkpointed is the last page saved, and the high-water mark the
+        publication date of the latest review seen.  Returns the date
+        reviews were imported from, or ``None`` if all reviews were.
+        """
+        state = SyncState.objects.get_state(PROVIDER, REVIEWS_COMMAND)
+        earliest_review_date = state.high_water
+        if earliest_review_date is None:
+            # Fall back to the most recent review in the database, if there
+            # is one.
+            try:
+                earliest_review_date = Review.objects.all()[0].publication_date
+            except IndexError:
+                pass
+            # Keep it with the checkpoints, so an interrupted run resumes
+            # with the same date.
+            state.high_water = earliest_review_date
+        if earliest_review_date:
             logger.debug("Earliest review date: %s." % earliest_review_date)
-        except IndexError:
-            earliest_review_date = None
+        else:
             logger.debug("No earliest date set; retrieving all reviews.")
-        # Get the first page of reviews.
-        logger.debug("Retrieving reviews page 1.")
-        first_page = json.loads(urllib2.urlopen(api_url(1,
-            earliest_review_date)).read())
+        # Carry on from the last page saved if the last run was interrupted.
+        # The results are ordered oldest first, so the earlier pages are
+        # unchanged.
+        first_page_number = 1
+        if state.is_interrupted():
+            first_page_number = int(state.position) + 1
+            logger.info("Resuming from reviews page %d." % first_page_number)
+        logger.debug("Retrieving reviews page %d." % first_page_number)
+        first_page = fetch_page(api_url(first_page_number,
+            earliest_review_date))
+        if first_page is None:
+            logger.error("Couldn't retrieve reviews page %d." %
+                first_page_number)
+            return earliest_review_date
         number_of_pages = int(first_page["response"]["pages"])
         logger.debug("API indicates %d pages in total." % number_of_pages)
+        high_water = [earliest_review_date]
+
+        def save_page(page_number, page):
+            """Save a page of reviews and checkpoint it."""
+            results = page["response"]["results"]
+            saved = save_reviews(results)
+            for review in map(parse_review, results):
+                if review is None:
+                    continue
+                date = review[1]["publication_date"]
+                if high_water[0] is None or date > high_water[0]:
+                    high_water[0] = date
+            state.checkpoint(page_number)
+            return saved
+
         saved_reviews = 0
-        for review in first_page["response"]["results"]:
-            if save_review(review):
-                saved_reviews += 1
-        # Get reviews on page 2 of the API results onwards.
-        page_range = range(2, number_of_pages + 1)
-        for page in page_range:
-            logger.debug("Retrieving reviews page %d." % page)
-            found_page = False
-            while not found_page:
-                try:
-                    page = json.loads(urllib2.urlopen(api_url(page,
-                        earliest_review_date)).read())
-                    found_page = True
-                except urllib2.HTTPError:
-                    # If the page couldn't be retrieved for any reason, retry.
-                    # This is pretty brute force -- it'll loop for a long time
-                    # if the API limit has been reached for example -- but it
-                    # should do for our needs.
-                    pass
-            for review in page["response"]["results"]:
-                saved_reviews += save_review(review)
+        if first_page_number <= number_of_pages:
+            saved_reviews += save_page(first_page_number, first_page)
+        # Get the following pages of the API results, a few pages at a time.
+        # If a page can't be retrieved no later pages are saved, so the next
+        # run carries on from that page.
+        page_range = range(first_page_number + 1, number_of_pages + 1)
+        window = runner.workers * PAGES_PER_WORKER
+        page = first_page
+        for start in range(0, len(page_range), window):
+            pages = page_range[start:start + window]
+            logger.debug("Retrieving reviews pages %d to %d." % (pages[0],
+                pages[-1]))
+            results = runner.run([functools.partial(fetch_page, api_url(page,
+                earliest_review_date)) for page in pages])
+            for page_number, page in zip(pages, results):
+                if page is None:
+                    break
+                saved_reviews += save_page(page_number, page)
+            if page is None:
+                logger.error("Couldn't retrieve reviews page %d; stopping."
+                    % page_number)
+                break
         logger.info("Saved %d new reviews." % saved_reviews)
+        if page is not None:
+            state.finish(high_water[0])
+        return earliest_review_date
 
-        # Now we need to get old reviews for artists created after the latest
-        # review date.
-        if earliest_review_date:
-            earliest_artist_creation = (datetime.datetime.today() -
-                datetime.timedelta(days=2))
-            artists = Artist.objects.published(
-                created__gte=earliest_artist_creation).exclude(mbid="")
-            logger.info("%d artists created within the last two days." % len(
-                artists))
-            for artist in artists:
-                artist_api_url = api_url(page=1,
-                    reference="musicbrainz/%s" % artist.mbid)
-                found_page = False
-                while not found_page:
-                    try:
-                        page = json.loads(urllib2.urlopen(
-                            artist_api_url).read())
-                        found_page = True
-                        artist_reviews = 0
-                        for review in page["response"]["results"]:
-                            artist_reviews += save_review(review)
-                        logger.info("Saved %d reviews for %s." % (
-                            artist_reviews, artist.name))
-                    except urllib2.HTTPError:
-                        # If the page couldn't be retrieved for any reason,
-                        # retry.  This is pretty brute force -- it'll loop
-                        # for a long time if the API limit has been reached for
-                        # example -- but it should do for our needs.
-                        pass
+    def import_artist_reviews(self, runner, logger):
+        """
+        Import older reviews for artists created since the last import.
+        The position checkpointed is the id of the last artist completed,
+        and the high-water mark the time the last complete run started.
+        """
+        state = SyncState.objects.get_state(PROVIDER, ARTIST_REVIEWS_COMMAND)
+        started = datetime.datetime.now()
+        # Look at artists created in the last two days at least, as an
+        # artist's MusicBrainz id is looked up after it's created.
+        earliest_artist_creation = started - datetime.timedelta(days=2)
+        if state.high_water:
+            earliest_artist_creation = min(earliest_artist_creation,
+                state.high_water - datetime.timedelta(days=2))
+        artists = Artist.objects.published(
+            created__gte=earliest_artist_creation).exclude(mbid="").order_by(
+            'id')
+        if state.is_interrupted():
+            logger.info("Resuming after artist %s." % state.position)
+            artists = artists.filter(id__gt=int(state.position))
+        artists = list(artists)
+        logger.info("%d artists created since %s." % (len(artists),
+            earliest_artist_creation))
+        for start in range(0, len(artists), runner.workers):
+            batch = artists[start:start + runner.workers]
+            results = runner.run([functools.partial(fetch_page, api_url(
+                page=1, reference="musicbrainz/%s" % artist.mbid))
+                for artist in batch])
+            for artist, page in zip(batch, results):
+                if page is None:
+                    logger.error("Couldn't retrieve reviews for %s." %
+                        artist.name)
+                    continue
+                artist_reviews = save_reviews(page["response"]["results"])
+                logger.info("Saved %d reviews for %s." % (artist_reviews,
+                    artist.name))
+            state.checkpoint(batch[-1].id)
+        state.finish(started)
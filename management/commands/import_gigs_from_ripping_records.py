@@ -1,19 +1,40 @@
 import csv
 import datetime
-import logging
-import logging.config
+import hashlib
+from optparse import make_option
 import re
+from StringIO import StringIO
+import sys
 import unicodedata
 import urllib2
 
 from django.conf import settings
 from django.core.management.base import NoArgsCommand
-from django.db import DatabaseError
+from django.db import DatabaseError, transaction
 from django.template.defaultfilters import slugify
+from django.utils.encoding import force_unicode
 
-from gigs.models import Gig, Artist, Venue, Town, Promoter, ImportIdentifier
+from gigs.bulk import bulk_add_m2m, bulk_insert, chunks, filter_in,\
+    m2m_pairs
+from gigs.connections import urlopen
+from gigs.counters import recount_upcoming_gigs
+from gigs.instrumentation import RunReport
+from gigs.management import get_logger
+from gigs.models import Gig, Artist, Venue, Town, Promoter,\
+    ImportIdentifier, RowFingerprint, SyncState, identifier_digest
 
 
+# Default number of gigs saved in each transaction.
+BATCH_SIZE = 200
+# Number of imports in a row a failed row is tried again in while the
+# spreadsheet is unchanged.  After that it's only tried again when the
+# spreadsheet changes.
+MAX_ROW_FAILURES = 5
+# The town assumed for gigs whose row doesn't give one.
+DEFAULT_TOWN = 'Edinburgh'
+# The ``SyncState`` holding the spreadsheet's validators.
+PROVIDER = 'ripping_records'
+COMMAND = 'import_gigs_from_ripping_records'
 MONTHS = {
     'JANUARY': 1, 'FEBRUARY': 2, 'MARCH': 3, 'APRIL': 4, 'MAY': 5, 'JUNE': 6,
     'JULY': 7, 'AUGUST': 8, 'SEPTEMBER': 9, 'OCTOBER': 10, 'NOVEMBER': 11,
@@ -36,6 +57,125 @@ PRICE_RE = re.compile(
 )
 
 
+# Kinds of row found in the spreadsheet.
+BLANK_ROW = 'blank'
+TEXT_ROW = 'text'
+MONTH_ROW = 'month'
+HEADER_ROW = 'header'
+PADDING_ROW = 'padding'
+GIG_ROW = 'gig'
+# Maximum number of cell values each ``CellParser`` cache holds.
+MAX_CACHED_CELLS = 10000
+
+
+def make_usable_string(value):
+    """
+    Convert to an ASCII string, removing any suspicious characters in the
+    process.  This includes the asterisks added by Google Docs to indicate
+    emphasis in the original HTML.
+    """
+    return unicodedata.normalize('NFKD', unicode(value)).encode('ascii',
+        'ignore').strip('*')
+
+
+def classify_row(row):
+    """
+    Return a tuple of the kind of a spreadsheet row and, for a month
+    header row, the number of the month.
+    """
+    if len(row) < 4:
+        # If there are fewer than four columns in a row it's either a
+        # header row indicating a new month, or blank or filled with
+        # useless information.
+        if not row:
+            return BLANK_ROW, None
+        month_match = MONTH_RE.match(row[0])
+        if month_match:
+            return MONTH_ROW, MONTHS[month_match.group('month').upper()]
+        return TEXT_ROW, None
+    # If there are four columns it's probably a gig.  The only other
+    # possibilities are if the first column is "*DATE*" (which means it's a
+    # header row) or if all columns are "--" which means the Google
+    # spreadsheet has fewer rows than last time (Google pads it out).
+    if row[0] == '*DATE*':
+        return HEADER_ROW, None
+    if row[0] == '--':
+        return PADDING_ROW, None
+    return GIG_ROW, None
+
+
+class CellParser(object):
+
+    """
+    Parses the cells of gig rows.  The same artists, venues, and prices
+    appear again and again in the spreadsheet, so the parsed form of each
+    cell value is cached.  Each cache holds at most ``max_size`` values
+    and is emptied when it's full.
+    """
+
+    def __init__(self, max_size=MAX_CACHED_CELLS):
+        self.max_size = max_size
+        self.caches = {}
+
+    def _cached(self, name, func, value):
+        cache = self.caches.setdefault(name, {})
+        try:
+            return cache[value]
+        except KeyError:
+            result = func(value)
+            if len(cache) >= self.max_size:
+                cache.clear()
+            if self.max_size:
+                cache[value] = result
+            return result
+
+    def day(self, value):
+        """Return the day of the month from a cell like "mon 18th"."""
+        return self._cached('day', _parse_day, value)
+
+    def artist(self, value):
+        """Return the artist's name from an artist cell."""
+        return self._cached('artist', make_usable_string, value)
+
+    def venue_and_promoter(self, value):
+        """
+        Return a ``(venue, town, promoter)`` tuple from a venue cell.  The
+        town and promoter may be ``None``.
+        """
+        return self._cached('venue', _parse_venue_and_promoter, value)
+
+    def price_and_info(self, value):
+        """
+        Return a ``(price, info, sold_out, cancelled)`` tuple from a price
+        cell.  The price and info may be ``None``.
+        """
+        return self._cached('price', _parse_price_and_info, value)
+
+
+def _parse_day(value):
+    return int(DATE_RE.match(value.strip('*')).group('day'))
+
+
+def _parse_venue_and_promoter(value):
+    # Venue and promoter and stored in one cell so a regular expression is
+    # used to separate the two.  Promoter won't always appear.
+    match = VENUE_AND_PROMOTER_RE.match(make_usable_string(value))
+    return match.group('venue'), match.group('town'), match.group('promoter')
+
+
+def _parse_price_and_info(value):
+    # Price(s) and extra info are stored in one field, so they're separated
+    # here.  There can be zero or more prices, and the extra info doesn't
+    # always appear, but there will always be at least one.
+    match = PRICE_RE.match(make_usable_string(value))
+    status = match.group('status')
+    return (match.group('price'), match.group('info'), status == 'SOLD OUT',
+        status == 'CANCELLED')
+
+
+default_parser = CellParser()
+
+
 class RippedGig(object):
 
     """
@@ -52,54 +192,609 @@ class RippedGig(object):
       * ``price_and_info``: string containing the ticket price and any
         miscellaneous information in a format that can be handled by
         ``PRICE_RE``.
+      * ``key``: the key used to fingerprint the row in the spreadsheet
+        (optional).
+      * ``parser``: the ``CellParser`` used to parse the cells (optional).
+
+    The ``row`` attribute holds the spreadsheet row the gig came from, with
+    the year and month it's listed under, if it's known.
+
+    An import creates one of these for every row, so ``__slots__`` keeps
+    them small.
     """
 
-    def __init__(self, artist, venue_and_promoter, date, price_and_info):
-        self.artist = self._make_usable_string(artist)
+    __slots__ = ('key', 'row', 'artist', 'venue', 'town', 'promoter', 'date',
+        'price', 'info', 'sold_out', 'cancelled')
 
-        # Venue and promoter and stored in one cell so a regular
-        # expression is used to separate the two.  Promoter won't always
-        # appear.
-        venue_and_promoter_match = VENUE_AND_PROMOTER_RE.match(
-            self._make_usable_string(venue_and_promoter))
-        self.venue = venue_and_promoter_match.group('venue')
-        self.town = venue_and_promoter_match.group('town')
-        self.promoter = venue_and_promoter_match.group('promoter')
+    def __init__(self, artist, venue_and_promoter, date, price_and_info,
+        key=None, parser=default_parser):
+        self.key = key
+        self.row = None
+        self.artist = parser.artist(artist)
+        self.venue, self.town, self.promoter = parser.venue_and_promoter(
+            venue_and_promoter)
         self.date = date
-
-        # Price(s) and extra info are stored in one field, so they're
-        # separated here.  There can be zero or more prices, and the
-        # extra info doesn't always appear, but there will always be at
-        # least one.
-        price_and_info_match = PRICE_RE.match(self._make_usable_string(
-            price_and_info))
-        self.price = price_and_info_match.group('price')
-        self.info = price_and_info_match.group('info')
-        if price_and_info_match.group('status') == "SOLD OUT":
-            self.sold_out = True
-            self.cancelled = False
-        elif price_and_info_match.group('status') == "CANCELLED":
-            self.cancelled = True
-            self.sold_out = False
-        else:
-            self.sold_out = False
-            self.cancelled = False
+        self.price, self.info, self.sold_out, self.cancelled = \
+            parser.price_and_info(price_and_info)
 
     def __unicode__(self):
         return "%s at %s on %s" % (self.artist, self.venue, self.date)
 
-    def _make_usable_string(self, str):
+
+def gig_identifier(gig):
+    """
+    Return the string used to identify a ``RippedGig`` between imports,
+    based on the gig's artist, venue, and date.
+    """
+    return '%s at %s on %s' % (gig.artist, gig.venue, gig.date)
+
+
+def row_identifier(row, year, month, parser=default_parser):
+    """
+    Return the ``gig_identifier()`` of a gig row listed under a month and
+    year, without creating a ``RippedGig``.
+    """
+    return '%s at %s on %s' % (parser.artist(row[1]),
+        parser.venue_and_promoter(row[2])[0],
+        datetime.date(year, month, parser.day(row[0])))
+
+
+class IdentifierResolver(object):
+
+    """
+    Matches the strings used on the Ripping Records site to the model
+    objects they identify, using ``ImportIdentifier``.
+
+    Rather than querying the database for every row, all the identifiers
+    of a type -- and the objects they're linked to -- are loaded in bulk
+    by ``load()``.  Objects created during the import are registered with
+    ``create()`` or ``add()``, and their identifiers are stored in bulk by
+    ``flush()`` once each batch of gigs is saved.
+    """
+
+    MODELS = {
+        ImportIdentifier.GIG_IMPORT_TYPE: Gig,
+        ImportIdentifier.ARTIST_IMPORT_TYPE: Artist,
+        ImportIdentifier.VENUE_IMPORT_TYPE: Venue,
+        ImportIdentifier.TOWN_IMPORT_TYPE: Town,
+        ImportIdentifier.PROMOTER_IMPORT_TYPE: Promoter,
+    }
+
+    def __init__(self, report=None):
+        self.report = report
+        # Identifier string -> ``ImportIdentifier`` id, for each type.
+        self.identifier_ids = dict((t, {}) for t in self.MODELS)
+        # Identifier string -> model object, for each type.
+        self.objects = dict((t, {}) for t in self.MODELS)
+        # Model objects whose name matches an identifier that isn't linked
+        # to anything.
+        self.unlinked = dict((t, {}) for t in self.MODELS)
+        # Identifier string -> model object, for links yet to be stored.
+        self.pending = dict((t, {}) for t in self.MODELS)
+        # ``(type, identifier)`` tuples for each link added, in order, so
+        # links can be forgotten if their objects are rolled back.
+        self.added = []
+        # Whether any identifiers have yet to have their digest set.
+        self.undigested = None
+
+    def has_undigested(self):
+        """
+        Return ``True`` if any identifiers were stored without a digest.
+        The database is only asked once.
+        """
+        if self.undigested is None:
+            self.undigested = ImportIdentifier.objects.filter(
+                digest='').count() > 0
+        return self.undigested
+
+    def load(self, import_type, identifiers=None):
+        """
+        Load the identifiers of the given type, and the objects they link
+        to.  If ``identifiers`` is given only those identifiers are loaded,
+        otherwise every identifier of the type is.
+        """
+        model = self.MODELS[import_type]
+        queryset = ImportIdentifier.objects.filter(
+            type=import_type).values_list('identifier', 'id')
+        if identifiers is None:
+            rows = list(queryset)
+        else:
+            identifiers = set(identifiers)
+            rows = filter_in(queryset, 'digest',
+                [identifier_digest(i) for i in identifiers])
+            # Identifiers stored before digests were added have a blank
+            # digest until ``compact_import_identifiers`` is run, so look
+            # up any not found by their string, and fill in their digests.
+            missing = identifiers.difference([i for i, pk in rows])
+            if missing and self.has_undigested():
+                undigested = filter_in(queryset.filter(digest=''),
+                    'identifier', missing)
+                for identifier, pk in undigested:
+                    ImportIdentifier.objects.filter(id=pk).update(
+                        digest=identifier_digest(identifier))
+                rows.extend(undigested)
+        identifier_ids = self.identifier_ids[import_type]
+        identifier_ids.update(rows)
+        names = dict((pk, identifier) for identifier, pk in rows)
+
+        # Follow the links from each identifier to its model object.
+        links = m2m_pairs(model, 'import_identifiers', names.keys())
+        objects = model.objects.all()
+        if model is Gig:
+            objects = objects.select_related()
+        objects = dict((obj.pk, obj) for obj in filter_in(objects, 'id',
+            [obj_id for obj_id, identifier_id in links]))
+        for obj_id, identifier_id in links:
+            self.objects[import_type][names[identifier_id]] = objects[obj_id]
+
+        # An object may have been created without its identifier being
+        # stored (if a previous import was interrupted, for example), so
+        # look for any objects with the same name as an unlinked identifier.
+        if model is not Gig and identifiers is not None:
+            unlinked = identifiers.difference(self.objects[import_type])
+            for obj in filter_in(model.objects.all(), 'name', unlinked):
+                self.unlinked[import_type][obj.name] = obj
+
+    def get(self, import_type, identifier):
+        """
+        Return the model object linked to an identifier, or ``None`` if
+        there isn't one.
+        """
+        try:
+            return self.objects[import_type][identifier]
+        except KeyError:
+            obj = self.unlinked[import_type].pop(identifier, None)
+            if obj is not None:
+                self.add(import_type, identifier, obj)
+            return obj
+
+    def add(self, import_type, identifier, obj):
+        """Link an identifier to a model object."""
+        self.objects[import_type][identifier] = obj
+        self.pending[import_type][identifier] = obj
+        self.added.append((import_type, identifier))
+
+    def savepoint(self):
+        """
+        Return a marker that can be passed to ``rollback()`` to forget the
+        links added after it.
+        """
+        return len(self.added)
+
+    def rollback(self, mark):
+        """
+        Forget the links added since ``savepoint()`` returned ``mark``,
+        because the database changes that created their objects have been
+        rolled back.
+        """
+        for import_type, identifier in self.added[mark:]:
+            self.objects[import_type].pop(identifier, None)
+            self.pending[import_type].pop(identifier, None)
+        del self.added[mark:]
+
+    def create(self, import_type, name, logger, **kwargs):
+        """
+        Create a model object for a new identifier, returning the object or
+        ``None`` if it couldn't be saved.
+        """
+        model = self.MODELS[import_type]
+        slug = slugify(name)[:50]
+        sid = transaction.savepoint()
+        try:
+            obj = model.objects.create(name=name, slug=slug, **kwargs)
+        except DatabaseError:
+            # The database couldn't save the object.  This is usually
+            # because an object with the same slug exists (i.e. the name
+            # is unique but it matches another object's slug).
+            transaction.savepoint_rollback(sid)
+            logger.critical("Failed to save %s %s with slug '%s'." % (
+                model._meta.verbose_name, name, slug))
+            return None
+        transaction.savepoint_commit(sid)
+        logger.info('Created %s: %s.' % (model._meta.verbose_name, obj))
+        if self.report is not None:
+            self.report.count(model._meta.module_name, 'created')
+        self.add(import_type, name, obj)
+        return obj
+
+    def flush(self):
+        """
+        Store any new identifiers, and the links between identifiers and
+        model objects, using one bulk insert per table.
+        """
+        for import_type, pending in self.pending.items():
+            if not pending:
+                continue
+            identifier_ids = self.identifier_ids[import_type]
+            new_identifiers = [i for i in pending if i not in identifier_ids]
+            digests = [identifier_digest(i) for i in new_identifiers]
+            bulk_insert([ImportIdentifier(identifier=i, digest=digest,
+                type=import_type) for i, digest in zip(new_identifiers,
+                digests)])
+            identifier_ids.update(filter_in(ImportIdentifier.objects.filter(
+                type=import_type).values_list('identifier', 'id'),
+                'digest', digests))
+            bulk_add_m2m(self.MODELS[import_type], 'import_identifiers',
+                [(obj.pk, identifier_ids[identifier])
+                for identifier, obj in pending.items()])
+            pending.clear()
+        del self.added[:]
+
+
+class GigIndex(object):
+
+    """
+    Finds existing gigs by artist and date, so venue changes can be spotted
+    without a query for every new gig, and collects changes to the gigs'
+    sold out and cancelled flags so they can be applied in bulk.
+
+    Every gig between the first and last of the given dates is loaded in
+    one query.
+    """
+
+    def __init__(self, dates):
+        # ``(artist id, date)`` -> list of gigs.
+        self.gigs = {}
+        # ``(field name, value)`` -> set of ids of gigs to update.
+        self.updates = {}
+        if dates:
+            for gig in Gig.objects.filter(date__range=(min(dates),
+                    max(dates))).select_related('venue'):
+                self.add(gig)
+
+    def add(self, gig):
+        """Add a gig to the index."""
+        self.gigs.setdefault((gig.artist_id, gig.date), []).append(gig)
+
+    def find_moved(self, artist, date, venue):
+        """
+        Return a gig by the artist on the date at a venue other than the
+        one given, or ``None`` if there isn't one.
+        """
+        for gig in self.gigs.get((artist.pk, date), []):
+            if gig.venue_id != venue.pk:
+                return gig
+        return None
+
+    def set_flag(self, gig, field_name, value):
+        """
+        Change a gig's flag.  The database isn't updated until ``apply()``
+        is called.
+        """
+        setattr(gig, field_name, value)
+        self.updates.setdefault((field_name, value), set()).add(gig.pk)
+
+    def apply(self):
+        """
+        Save the flag changes, using one ``UPDATE`` per chunk of gigs for
+        each field and value.
+        """
+        for (field_name, value), ids in self.updates.items():
+            for chunk in chunks(ids):
+                Gig.objects.filter(id__in=chunk).update(**{field_name: value})
+        self.updates.clear()
+
+
+class VenueChanges(object):
+
+    """
+    Collects the gigs that look like an existing gig moved to a new venue
+    -- the same artist on the same date at a different venue -- so they
+    can be decided on once the whole spreadsheet has been read.
+
+    The spreadsheet can list an artist at two venues on the same day, so
+    an existing gig has only moved if no row in the spreadsheet still lists
+    it, under any of its identifiers.  Otherwise the new row is a separate
+    gig.
+    """
+
+    def __init__(self, listed=None):
+        # Identifiers of every gig row in the spreadsheet, or ``None`` if
+        # only some of the rows are being imported, in which case no gig
+        # is treated as moved.
+        self.listed = listed
+        # ``(ripped gig, artist, venue, promoter, existing gig)`` tuples.
+        self.candidates = []
+
+    def add(self, gig, artist, venue, promoter, db_gig):
+        """Record that a ``RippedGig`` may be ``db_gig`` at a new venue."""
+        self.candidates.append((gig, artist, venue, promoter, db_gig))
+
+    def decide(self):
+        """
+        Return a list of ``(ripped gig, artist, venue, promoter, existing
+        gig)`` tuples, where the existing gig is ``None`` if the ripped gig
+        is a new gig rather than a moved one.  Each existing gig can only
+        move once.
+        """
+        # Ids of the existing gigs that are still listed.
+        listed = set([candidate[4].pk for candidate in self.candidates])
+        if self.listed is not None:
+            pairs = m2m_pairs(Gig, 'import_identifiers', source_ids=listed)
+            names = dict(filter_in(ImportIdentifier.objects.values_list('id',
+                'identifier'), 'id', [identifier_id for gig_id, identifier_id
+                in pairs]))
+            listed = set([gig_id for gig_id, identifier_id in pairs
+                if names[identifier_id] in self.listed])
+        decisions = []
+        for gig, artist, venue, promoter, db_gig in self.candidates:
+            if db_gig.pk in listed:
+                db_gig = None
+            else:
+                listed.add(db_gig.pk)
+            decisions.append((gig, artist, venue, promoter, db_gig))
+        self.candidates = []
+        return decisions
+
+
+def failed_rows(max_failures):
+    """
+    Return a ``QuerySet`` of the stored rows that failed last time and
+    haven't failed ``max_failures`` times in a row.
+    """
+    return RowFingerprint.objects.filter(fingerprint='',
+        failures__lt=max_failures).exclude(row='')
+
+
+def encode_row(row, year, month):
+    """
+    Return a gig row, with the year and month it's listed under, as a line
+    of CSV.
+    """
+    output = StringIO()
+    csv.writer(output).writerow([year, month] + list(row))
+    return output.getvalue()
+
+
+def decode_row(value):
+    """Return the ``(row, year, month)`` tuple encoded by ``encode_row()``."""
+    cells = csv.reader(StringIO(force_unicode(value).encode('utf-8'))).next()
+    return cells[2:], int(cells[0]), int(cells[1])
+
+
+class RowFingerprints(object):
+
+    """
+    Keeps track of which rows in the spreadsheet are new, changed,
+    unchanged, or have vanished since the last successful import, using
+    the ``RowFingerprint`` model.  Rows that couldn't be imported are
+    stored so they can be tried again, and are counted as retried rather
+    than changed.
+    """
+
+    NEW = 'new'
+    CHANGED = 'changed'
+    UNCHANGED = 'unchanged'
+    RETRIED = 'retried'
+
+    def __init__(self):
+        # Row key -> fingerprint, as stored by the last successful import.
+        # Rows that failed have a blank fingerprint.
+        self.stored = dict(RowFingerprint.objects.values_list('key',
+            'fingerprint'))
+        # Row key -> number of imports in a row the row has failed in.
+        self.failures = dict(RowFingerprint.objects.filter(
+            failures__gt=0).values_list('key', 'failures'))
+        # Row key -> fingerprint, for every gig row seen in this import.
+        self.seen = {}
+        # Row key -> ``(row, year, month)``, for rows that couldn't be
+        # imported.
+        self.failed = {}
+        self.counts = {self.NEW: 0, self.CHANGED: 0, self.UNCHANGED: 0,
+            self.RETRIED: 0}
+        # Whether only the rows that failed last time are being imported,
+        # rather than the whole spreadsheet.
+        self.retrying = False
+
+    def add(self, row, year, month):
         """
-        Convert to an ASCII string, removing any suspicious characters in
-        the process.  This includes the asterisks added by Google Docs to
-        indicate emphasis in the original HTML.
+        Fingerprint a gig row listed under the given month and year.
+        Returns a tuple of the row's key and whether the row is new,
+        changed, unchanged, or being retried after failing last time.
         """
-        return unicodedata.normalize('NFKD', unicode(str)).encode('ascii',
-            'ignore').strip('*')
+        key = hashlib.sha1('\x1f'.join([str(year), str(month), row[0],
+            row[1]])).hexdigest()
+        # The same artist can play twice on the same day, so make sure
+        # each row's key is unique.
+        while key in self.seen:
+            key = hashlib.sha1(key).hexdigest()
+        return key, self._see(key, row, year, month)
+
+    def _see(self, key, row, year, month):
+        fingerprint = hashlib.sha1('\x1f'.join([str(year), str(month)] +
+            row)).hexdigest()
+        self.seen[key] = fingerprint
+        if key not in self.stored:
+            status = self.NEW
+        elif not self.stored[key]:
+            status = self.RETRIED
+        elif self.stored[key] != fingerprint:
+            status = self.CHANGED
+        else:
+            status = self.UNCHANGED
+        self.counts[status] += 1
+        return status
+
+    def retry(self, max_failures):
+        """
+        Return a list of ``(key, row, year, month)`` tuples for the rows
+        that failed last time, unless they've failed ``max_failures`` times
+        in a row, and only import those.  The rest of the spreadsheet is
+        left as it was.
+        """
+        self.retrying = True
+        rows = []
+        for key, value in failed_rows(max_failures).values_list('key',
+                'row'):
+            row, year, month = decode_row(value)
+            self._see(key, row, year, month)
+            rows.append((key, row, year, month))
+        return rows
+
+    def fail(self, key, row=None):
+        """
+        Mark a row as not imported, so it will be tried again next time.
+        ``row`` is the ``(row, year, month)`` tuple the row was read as;
+        without it the row is only tried again when the spreadsheet
+        changes.
+        """
+        self.failed[key] = row
+
+    def given_up(self, max_failures):
+        """
+        Return a list of the ``(row, year, month)`` tuples for the rows
+        that have now failed ``max_failures`` times in a row, and so won't
+        be tried again until the spreadsheet changes.
+        """
+        return [row for key, row in self.failed.items()
+            if row is not None and
+            self.failures.get(key, 0) + 1 == max_failures]
+
+    def vanished(self):
+        """
+        Return a list of the keys for rows stored by the last import that
+        are no longer in the spreadsheet.
+        """
+        if self.retrying:
+            return []
+        return [key for key in self.stored if key not in self.seen]
+
+    def save(self):
+        """
+        Store the fingerprints of every row that was imported successfully
+        and the rows that failed, and forget those rows no longer in the
+        spreadsheet.
+        """
+        changed = [key for key, fingerprint in self.seen.items()
+            if key in self.stored and self.stored[key] != fingerprint and
+            key not in self.failed]
+        failed = [key for key in self.failed if key in self.stored]
+        for chunk in chunks(changed + failed + self.vanished()):
+            RowFingerprint.objects.filter(key__in=chunk).delete()
+        bulk_insert([RowFingerprint(key=key, fingerprint=fingerprint)
+            for key, fingerprint in self.seen.items()
+            if (key not in self.stored or key in changed) and
+            key not in self.failed])
+        bulk_insert([RowFingerprint(key=key, fingerprint='',
+            row=row and encode_row(*row) or '',
+            failures=self.failures.get(key, 0) + 1)
+            for key, row in self.failed.items()])
+
+
+def fetch_spreadsheet(url, state=None):
+    """
+    Open the published spreadsheet, returning the response.  If a
+    ``SyncState`` holding the validators from the last import is given the
+    request is conditional, and ``None`` is returned if the spreadsheet
+    hasn't changed since.
+    """
+    request = urllib2.Request(url)
+    request.add_header('User-Agent', 'Ripping Records scraper')
+    if state is not None:
+        if state.etag:
+            request.add_header('If-None-Match', state.etag)
+        if state.last_modified:
+            request.add_header('If-Modified-Since', state.last_modified)
+    try:
+        return urlopen(request)
+    except urllib2.HTTPError, e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def dated_rows(rows, logger):
+    """
+    Yield a ``(row, year, month)`` tuple for each gig row in the
+    spreadsheet.  The month each gig takes place in is given in a header
+    row rather than in each row, so the header rows are used to keep track
+    of the month and year.
+    """
+    # Current month holds the current month the gigs occur.
+    current_month = 1
+    # Although the year the gigs take place is never mentioned, it's
+    # obviously this year.  But we need to keep track of it so we can
+    # increment it if we come across gigs in the next year (i.e. when
+    # December becomes January).
+    current_year = datetime.date.today().year
+    for row in rows:
+        kind, month = classify_row(row)
+        if kind == GIG_ROW:
+            yield row, current_year, current_month
+        elif kind == MONTH_ROW:
+            # Month has changed.
+            logger.debug('Month changed from %s to %s.' % (
+                REVERSED_MONTHS[current_month], REVERSED_MONTHS[month]))
+            # If the old month was a higher number than the new month, it's
+            # a new year too.
+            if current_month > month:
+                logger.debug('Year changed from %d to %d.' % (
+                    current_year, current_year + 1))
+                current_year += 1
+            current_month = month
+        elif kind == TEXT_ROW:
+            # Text information we can safely ignore.
+            logger.debug("Unmatched row: '%s'." % ', '.join(row))
+        elif kind == BLANK_ROW:
+            logger.debug('Ignored blank row.')
+
+
+def ripped_gigs(rows, fingerprints, incremental, logger,
+    parser=default_parser, listed=None):
+    """
+    Yield a ``RippedGig`` for each ``(row, year, month)`` tuple, recording
+    each row's fingerprint.  If ``incremental`` is ``True`` rows that
+    haven't changed since the last import are skipped.  If ``listed`` is
+    given the identifier of every row, skipped or not, is added to it.
+    """
+    for row, year, month in rows:
+        if listed is not None:
+            listed.add(row_identifier(row, year, month, parser))
+        # Skip the row if it's exactly the same as it was in the last
+        # import.
+        key, status = fingerprints.add(row, year, month)
+        if incremental and status == RowFingerprints.UNCHANGED:
+            continue
+        # Create a gig based on this row.
+        logger.debug('Creating initial gig object.')
+        yield make_gig(key, row, year, month, parser)
+
+
+def retried_gigs(fingerprints, max_failures, logger, parser=default_parser):
+    """
+    Yield a ``RippedGig`` for each row that failed to import last time,
+    unless it has failed ``max_failures`` times in a row.  This is used
+    instead of ``ripped_gigs()`` when the spreadsheet hasn't changed.
+    """
+    for key, row, year, month in fingerprints.retry(max_failures):
+        logger.debug("Retrying row: '%s'." % ', '.join(row))
+        yield make_gig(key, row, year, month, parser)
+
+
+def make_gig(key, row, year, month, parser=default_parser):
+    """Return a ``RippedGig`` for a gig row listed under a month and year."""
+    # Date of the gig based on the month header row we'll have come
+    # across earlier and the date column, which contains the day of
+    # month in a format like "mon 18th".
+    date = datetime.date(year, month, parser.day(row[0]))
+    gig = RippedGig(row[1], row[2], date, row[3], key, parser)
+    gig.row = (row, year, month)
+    return gig
 
 
 class Command(NoArgsCommand):
     help = "Imports gigs from the Ripping Records web site via Google Docs."
+    base_options = (
+        make_option('-i', '--incremental', action='store_true', default=False,
+            help='Skip rows that are unchanged since the last successful import, and the whole spreadsheet if it is unchanged.'),
+        make_option('--batch-size', type='int', default=BATCH_SIZE,
+            help='Number of gigs saved in each transaction.'),
+        make_option('--report', metavar='FILE',
+            help="Write a JSON report of the run's timings, queries, and counts to FILE, or to standard output if FILE is '-'."),
+        make_option('--record', action='store_true', default=False,
+            help='Store the report in the import run history.'),
+    )
+    option_list = NoArgsCommand.option_list + base_options
 
     def handle_noargs(self, **options):
         """
@@ -111,245 +806,337 @@ class Command(NoArgsCommand):
         intermediate form, so Google does all the heavy lifting (i.e.
         screen-scraping the HTML).
 
+        The spreadsheet is streamed through a pipeline of generators --
+        CSV rows, rows with their month and year, ``RippedGig`` objects --
+        and the gigs are saved a batch at a time, so only one batch is held
+        in memory however long the spreadsheet is.
+
         Original data: http://rippingrecords.com/tickets01.html.
         """
         # Create the logger we'll use to store all the output.
-        logging.config.fileConfig("logging.conf")
-        logger = logging.getLogger('RippedRecordsLogger')
+        logger = get_logger()
         logger.info('Importing gigs from the Ripping Records spreadsheet.')
+        # Time each phase of the import and count its queries.
+        report = RunReport(COMMAND)
+        report.install()
+        try:
+            self.import_gigs(report, logger, options)
+        finally:
+            report.finish()
+        logger.info('Import took %.2f seconds and %d queries.' % (
+            report.duration, report.queries))
+        if options.get('report') == '-':
+            sys.stdout.write(report.to_json() + '\n')
+        elif options.get('report'):
+            report_file = open(options['report'], 'w')
+            try:
+                report_file.write(report.to_json())
+            finally:
+                report_file.close()
+        if options.get('record'):
+            report.save()
+
+    def import_gigs(self, report, logger, options):
+        """
+        Import the gigs, recording the time taken by each phase (fetching,
+        parsing, resolving identifiers, writing, fingerprinting, and
+        recounting) in the ``RunReport``.
+        """
+        # Fingerprints of each gig row, so rows that haven't changed since
+        # the last import can be skipped in incremental mode.
+        incremental = options.get('incremental', False)
+        state = SyncState.objects.get_state(PROVIDER, COMMAND)
 
-        # Get the CSV data from Google Docs.
+        # Get the CSV data from Google Docs.  In incremental mode nothing
+        # is downloaded if it hasn't changed since the last import.
         logger.debug('Retrieving data from Google Docs.')
-        request = urllib2.Request(settings.RIPPING_RECORDS_SPREADSHEET_URL)
-        request.add_header('User-Agent', 'Ripping Records scraper')
-        ripping_data = urllib2.build_opener().open(request)
-        logger.debug('Retrieved information.')
-
-        # Current month holds the current month the gigs occur (the month is
-        # given in a header row rather than in each row).
-        current_month = 1
-        # Although the year the gigs take place is never mentioned, it's
-        # obviously this year.  But we need to keep track of it so we can
-        # increment it if we come across gigs in the next year (i.e. when
-        # December becomes January).
-        current_year = datetime.date.today().year
-        # List of all included gigs.
-        gigs = []
-
-        # Parse the CSV data into individual gigs.  Each row is an individual
-        # gig, although the month each gig takes place in is a header row.
-        reader = csv.reader(ripping_data)
-        for row in reader:
-            if len(row) < 4:
-                # If there are fewer than four columns in a row it's either a
-                # header row indicating a new month, or blank or filled with
-                # useless information.
-                try:
-                    month_match = MONTH_RE.match(row[0])
-                    if month_match:
-                        # Month has changed.
-                        logger.debug('Month changed from %s to %s.' % (
-                            REVERSED_MONTHS[current_month],
-                            month_match.group('month')))
-                        # If the old month was a higher number than the new
-                        # month, it's a new year too.
-                        if current_month > MONTHS[month_match.group('month')]:
-                            logger.debug('Year changed from %d to %d.' % (
-                                current_year, current_year + 1))
-                            current_year += 1
-                        current_month = MONTHS[month_match.group('month')]
-                    else:
-                        # Text information we can safely ignore.
-                        logger.debug("Unmatched row: '%s'." % ', '.join(row))
-                except IndexError:
-                    # Blank row.
-                    logger.debug('Ignored blank row.')
-            else:
-                # If there are four columns it's probably a gig.  The only other
-                # possibilities are if the first column is "*DATE*" (which means
-                # it's a header row) or if all columns are "--" which means the
-                # Google spreadsheet has fewer rows than last time (Google pads
-                # it out).
-                if not row[0] in ("*DATE*", "--"):
-                    # Date of the gig based on the month header row we'll have
-                    # come across earlier and the date column, which contains
-                    # the day of month in a format like "mon 18th".
-                    date = datetime.date(current_year, current_month,
-                        int(DATE_RE.match(row[0].strip('*')).group('day')))
-                    # Create a gig based on this row.
-                    logger.debug('Creating initial gig object.')
-                    gigs.append(RippedGig(row[1], row[2], date, row[3]))
-
-        # That's the import done.  Now let's convert all the gigs into lovely
-        # Django models.
-        for gig in gigs:
-            logger.info('Processing gig: %s at %s on %s.' % (gig.artist,
-                gig.venue, gig.date))
-            # Find or create the gig's artist.
-            artist_id, created = ImportIdentifier.objects.get_or_create(
-                identifier=gig.artist, type=ImportIdentifier.ARTIST_IMPORT_TYPE)
-            try:
-                artist = artist_id.artist_set.all()[0]
-                logger.debug('Found artist: %s.' % artist)
-            except IndexError:
-                artist_slug = slugify(gig.artist)[:50]
-                try:
-                    artist = Artist.objects.create(name=gig.artist,
-                        slug=artist_slug)
-                    artist.import_identifiers.add(artist_id)
-                    artist.save()
-                    logger.info('Created artist: %s.' % artist)
-                except DatabaseError:
-                    # The database couldn't save the artist.  This is
-                    # usually because an artist with the same slug exists
-                    # (i.e. the artist's name is unique but it matches
-                    # another artist's slug).
-                    logger.critical("Failed to save artist %s with slug '%s'."
-                        % (gig.artist, artist_slug))
-
-            # Find or create the gig's town.  Occasionally this isn't included
-            # in the Ripping Records table row for the gig.
-            if gig.town:
-                town_id, created = ImportIdentifier.objects.get_or_create(
-                    identifier=gig.town, type=ImportIdentifier.TOWN_IMPORT_TYPE)
-                try:
-                    town = town_id.town_set.all()[0]
-                    logger.debug('Found town: %s.' % town)
-                except IndexError:
-                    town_slug = slugify(gig.town)[:50]
-                    try:
-                        town = Town.objects.create(name=gig.town,
-                            slug=town_slug)
-                        town.import_identifiers.add(town_id)
-                        town.save()
-                        logger.info('Created town: %s.' % town)
-                    except DatabaseError:
-                        # The database couldn't save the town.  This is usually
-                        # because a town with the same slug exists (i.e. the
-                        # town's name is unique but it matches another town's
-                        # slug).
-                        logger.critical("Failed to save town %s with slug '%s'."
-                            % (gig.town, town_slug))
-            else:
-                # Sometimes the town isn't included, so just assume it's
-                # Edinburgh and change it manually later.
-                town, created = Town.objects.get_or_create(name='Edinburgh')
-                logger.debug('No town listed for gig; using default.')
-
-            # Find or create the gig's venue.
-            venue_id, created = ImportIdentifier.objects.get_or_create(
-                identifier=gig.venue, type=ImportIdentifier.VENUE_IMPORT_TYPE)
-            try:
-                venue = venue_id.venue_set.all()[0]
-                logger.debug('Found venue: %s.' % venue)
-            except IndexError:
-                venue_slug = slugify(gig.venue)[:50]
-                try:
-                    venue = Venue.objects.create(name=gig.venue,
-                        slug=venue_slug, town=town)
-                    venue.import_identifiers.add(venue_id)
-                    venue.save()
-                    logger.info('Created venue: %s.' % venue)
-                except DatabaseError:
-                    # The database couldn't save the venue.  This is usually
-                    # because a venue with the same slug exists (i.e. the
-                    # venue's name is unique but it matches another venue's
-                    # slug).
-                    logger.critical("Failed to save venue %s with slug '%s'."
-                        % (gig.venue, venue_slug))
-
-            # Find or create the promoter. The promoter isn't always listed for
-            # a gig, so only create it exists.
-            promoter = None
-            if gig.promoter:
-                promoter_id, created = ImportIdentifier.objects.get_or_create(
-                    identifier=gig.promoter,
-                    type=ImportIdentifier.PROMOTER_IMPORT_TYPE)
-                try:
-                    promoter = promoter_id.promoter_set.all()[0]
-                    logger.debug('Found promoter: %s.' % promoter)
-                except IndexError:
-                    promoter_slug = slugify(gig.promoter)[:50]
-                    try:
-                        promoter = Promoter.objects.create(name=gig.promoter,
-                            slug=promoter_slug)
-                        promoter.import_identifiers.add(promoter_id)
-                        promoter.save()
-                        logger.info('Created promoter: %s.' % promoter)
-                    except DatabaseError:
-                        # The database couldn't save the promoter.  This is
-                        # usually because a promoter with the same slug exists
-                        # (i.e. the promoter's name is unique but it matches
-                        # another promoter's slug).
-                        logger.critical("Failed to save promoter %s with slug '%s'."
-                            % (gig.promoter, promoter_slug))
-            else:
-                logger.debug('No promoter found.')
-
-            # Return a unique identifier for this gig, based on the artist,
-            # venue, and date.
-            gig_identifier = '%s at %s on %s' % (gig.artist, gig.venue,
-                gig.date)
-            # Find or create the gig.
-            gig_id, created = ImportIdentifier.objects.get_or_create(
-                identifier=gig_identifier,
-                type=ImportIdentifier.GIG_IMPORT_TYPE)
+        ripping_data = report.time('fetch', fetch_spreadsheet,
+            settings.RIPPING_RECORDS_SPREADSHEET_URL,
+            incremental and state or None)
+        if ripping_data is None:
+            logger.info('Spreadsheet unchanged since the last import.')
+            # Only the rows that couldn't be imported last time need to be
+            # tried again, and they're stored, so there's no need to
+            # download the spreadsheet.
+            if not failed_rows(MAX_ROW_FAILURES).count():
+                return
+
+        fingerprints = report.time('fingerprints', RowFingerprints)
+        resolver = IdentifierResolver(report)
+        self.report = report
+        number_of_gigs = 0
+        if ripping_data is None:
+            self.venue_changes = VenueChanges()
+            gigs = report.iterate('parse', retried_gigs(fingerprints,
+                MAX_ROW_FAILURES, logger))
+        else:
+            # Parse the CSV data into individual gigs and convert them into
+            # lovely Django models.  Each row is an individual gig, although
+            # the month each gig takes place in is a header row.
+            listed = set()
+            self.venue_changes = VenueChanges(listed)
+            rows = csv.reader(report.iterate('fetch', ripping_data))
+            gigs = report.iterate('parse', ripped_gigs(dated_rows(rows,
+                logger), fingerprints, incremental, logger, listed=listed))
+        # Each batch of gigs is saved in one transaction rather than each
+        # query committing separately, so an interrupted import never
+        # leaves a batch half-saved.
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
             try:
-                db_gig = gig_id.gig_set.all()[0]
-                logger.info('Gig already exists.')
-                # If the gig already exists make sure it's marked appropriately
-                # as sold out, cancelled, or not.
-                if not db_gig.sold_out == gig.sold_out:
-                    db_gig.sold_out = gig.sold_out
-                    db_gig.save()
-                    logger.debug("Updated the gig's sold out flag.")
-                if not db_gig.cancelled == gig.cancelled:
-                    db_gig.cancelled = gig.cancelled
-                    db_gig.save()
-                    logger.debug("Updated the gig's cancelled flag.")
-            except IndexError:
-                # Check to see if a gig by the same artist is already
-                # happening on the same day in a different venue.  If there
-                # is, this new gig is likely to be that gig at a changed
-                # venue.
-                try:
-                    db_gig = Gig.objects.exclude(venue=venue).get(
-                        artist=artist, date=gig.date)
-                    logger.info('Gig changed venue: %s -> %s' % (db_gig, venue))
-                    db_gig.promoter = promoter
-                    db_gig.price = gig.price
-                    db_gig.sold_out = gig.sold_out
-                    db_gig.cancelled = gig.cancelled
-                    info_string = "Venue changed from %s to %s." % (
-                        db_gig.venue.name, venue.name)
-                    if gig.info:
-                        db_gig.extra_information = "%s. %s" % (gig.info,
-                            info_string)
-                    else:
-                        db_gig.extra_information = info_string
-                    db_gig.venue = venue
-                except Gig.DoesNotExist:
-                    # This is definitely a new gig we have here.
-                    try:
-                        db_gig = Gig.objects.create(artist=artist,
-                            slug=artist.slug, venue=venue, promoter=promoter,
-                            date=gig.date, price=gig.price,
-                            sold_out=gig.sold_out, cancelled=gig.cancelled,
-                            extra_information=gig.info)
-                        logger.info('Gig created: %s.' % db_gig)
-                        db_gig.import_identifiers.add(gig_id)
-                        db_gig.save()
-                    except DatabaseError:
-                        # Now here's a problem.  This tends to happen if the
-                        # ImportIdentifiers have got all mixed up.  Usually a
-                        # bit of manual jiggery-pokery is needed to fix this.
-                        logger.critical("Failed to save gig '%s'." % gig_id)
+                for batch in chunks(gigs, options.get('batch_size',
+                        BATCH_SIZE)):
+                    number_of_gigs += len(batch)
+                    self.save_gigs(batch, resolver, fingerprints, logger)
+                    report.time('write', transaction.commit)
+                # Venue changes can only be told apart from artists playing
+                # twice in a day once every row has been read.
+                report.time('write', self.save_venue_changes, resolver,
+                    fingerprints, logger)
+                report.time('write', transaction.commit)
+            except:
+                transaction.rollback()
+                raise
+        finally:
+            transaction.leave_transaction_management()
+            if ripping_data is not None:
+                ripping_data.close()
+        report.time('fingerprints', fingerprints.save)
+        for row, year, month in fingerprints.given_up(MAX_ROW_FAILURES):
+            logger.warning("Row '%s' under %s %d has failed to import %d "
+                "times; it won't be tried again until the spreadsheet "
+                "changes." % (', '.join(row), REVERSED_MONTHS[month], year,
+                MAX_ROW_FAILURES))
+        # Keep the spreadsheet's validators so the next incremental import
+        # can skip it if it's unchanged.  Rows that couldn't be imported
+        # are tried again from the stored copies.
+        if ripping_data is not None:
+            info = ripping_data.info()
+            state.etag = info.getheader('ETag') or ''
+            state.last_modified = info.getheader('Last-Modified') or ''
+        state.finish()
         logger.info('Import complete.')
-        # Finally, save every Artist, Venue, Town, and Promoter object.  This is
-        # a brute-force way of making sure every object's
+        logger.info('Rows: %d new, %d changed, %d unchanged, %d retried, '
+            '%d vanished.' % (fingerprints.counts[RowFingerprints.NEW],
+            fingerprints.counts[RowFingerprints.CHANGED],
+            fingerprints.counts[RowFingerprints.UNCHANGED],
+            fingerprints.counts[RowFingerprints.RETRIED],
+            len(fingerprints.vanished())))
+        for status, number in fingerprints.counts.items():
+            report.count('row', status, number)
+        report.count('row', 'vanished', len(fingerprints.vanished()))
+        if incremental:
+            report.count('gig', 'skipped',
+                fingerprints.counts[RowFingerprints.UNCHANGED])
+        report.count('gig', 'failed', len(fingerprints.failed))
+        if incremental and not number_of_gigs:
+            # Nothing has changed, so there's nothing to update.
+            return
+        # Finally, make sure every Artist, Venue, Town, and Promoter object's
         # ``number_of_upcoming_gigs`` field is correct and up-to-date.
-        logger.debug('Saving all models to update the number of upcoming gigs.')
-        for model in [Artist, Venue, Town, Promoter]:
-            for obj in model.objects.all():
-                obj.save(update_number_of_upcoming_gigs=True)
+        logger.debug('Recounting the number of upcoming gigs.')
+        for model, number in report.time('recount', recount_upcoming_gigs):
+            logger.debug('Updated %d %s.' % (number,
+                force_unicode(model._meta.verbose_name_plural)))
         logger.info('All model objects updated.')
+
+    def save_gigs(self, gigs, resolver, fingerprints, logger):
+        """
+        Save a batch of ``RippedGig`` objects.  All the identifiers used by
+        the batch, the objects they're linked to, and the existing gigs on
+        the batch's dates are loaded up-front so each gig can be matched
+        without going back to the database.  Flag changes and the
+        identifiers of new objects are stored together at the end.
+        """
+        self.report.start('resolve')
+        logger.debug('Loading import identifiers.')
+        resolver.load(ImportIdentifier.ARTIST_IMPORT_TYPE,
+            [gig.artist for gig in gigs])
+        resolver.load(ImportIdentifier.TOWN_IMPORT_TYPE,
+            [gig.town or DEFAULT_TOWN for gig in gigs])
+        resolver.load(ImportIdentifier.VENUE_IMPORT_TYPE,
+            [gig.venue for gig in gigs])
+        resolver.load(ImportIdentifier.PROMOTER_IMPORT_TYPE,
+            [gig.promoter for gig in gigs if gig.promoter])
+        resolver.load(ImportIdentifier.GIG_IMPORT_TYPE,
+            [gig_identifier(gig) for gig in gigs])
+        index = GigIndex([gig.date for gig in gigs])
+        self.report.stop()
+        self.report.start('write')
+        for gig in gigs:
+            self.in_savepoint(self.save_gig, gig, resolver, fingerprints,
+                logger, index)
+        logger.debug('Updating sold out and cancelled flags.')
+        index.apply()
+        # Store the identifiers for all the newly-created objects in one go.
+        logger.debug('Saving new import identifiers.')
+        resolver.flush()
+        self.report.stop()
+
+    def in_savepoint(self, func, gig, resolver, fingerprints, logger,
+        *args):
+        """
+        Call a function that saves a ``RippedGig`` inside its own
+        savepoint, so a database error only undoes that gig's changes.
+        The function is passed the gig, resolver, fingerprints, logger,
+        and any other arguments given.
+        """
+        mark = resolver.savepoint()
+        sid = transaction.savepoint()
+        try:
+            func(gig, resolver, fingerprints, logger, *args)
+        except DatabaseError:
+            # Now here's a problem.  This tends to happen if the
+            # ImportIdentifiers have got all mixed up.  Usually a bit of
+            # manual jiggery-pokery is needed to fix this.
+            transaction.savepoint_rollback(sid)
+            resolver.rollback(mark)
+            logger.critical("Failed to save gig '%s'." % gig_identifier(gig))
+            fingerprints.fail(gig.key, gig.row)
+        else:
+            transaction.savepoint_commit(sid)
+
+    def save_venue_changes(self, resolver, fingerprints, logger):
+        """
+        Move the existing gigs whose venue has changed, and create the
+        gigs that only looked like venue changes, once the whole
+        spreadsheet has been read.
+        """
+        for gig, artist, venue, promoter, db_gig in \
+                self.venue_changes.decide():
+            self.in_savepoint(self.save_venue_change, gig, resolver,
+                fingerprints, logger, artist, venue, promoter, db_gig)
+        resolver.flush()
+
+    def save_venue_change(self, gig, resolver, fingerprints, logger, artist,
+        venue, promoter, db_gig):
+        """
+        Move an existing gig to the ``RippedGig``'s venue or, if
+        ``db_gig`` is ``None``, create a new gig.
+        """
+        if db_gig:
+            logger.info('Gig changed venue: %s -> %s' % (db_gig, venue))
+            db_gig.promoter = promoter
+            db_gig.price = gig.price
+            db_gig.sold_out = gig.sold_out
+            db_gig.cancelled = gig.cancelled
+            info_string = "Venue changed from %s to %s." % (
+                db_gig.venue.name, venue.name)
+            if gig.info:
+                db_gig.extra_information = "%s. %s" % (gig.info, info_string)
+            else:
+                db_gig.extra_information = info_string
+            db_gig.venue = venue
+            db_gig.save()
+            self.report.count('gig', 'moved')
+        else:
+            db_gig = self.create_gig(gig, artist, venue, promoter, logger)
+        resolver.add(ImportIdentifier.GIG_IMPORT_TYPE, gig_identifier(gig),
+            db_gig)
+
+    def create_gig(self, gig, artist, venue, promoter, logger):
+        """
+        Create a new gig from a ``RippedGig``.  If it can't be saved the
+        ``DatabaseError`` is handled by ``in_savepoint()``.
+        """
+        db_gig = Gig.objects.create(artist=artist, slug=artist.slug,
+            venue=venue, promoter=promoter, date=gig.date, price=gig.price,
+            sold_out=gig.sold_out, cancelled=gig.cancelled,
+            extra_information=gig.info)
+        logger.info('Gig created: %s.' % db_gig)
+        self.report.count('gig', 'created')
+        return db_gig
+
+    def save_gig(self, gig, resolver, fingerprints, logger, index):
+        """
+        Save a ``RippedGig``, creating its artist, town, venue, and
+        promoter if they don't exist, or update the existing gig.  Changes
+        to existing gigs' flags are left in the ``GigIndex`` to be applied
+        in bulk, and possible venue changes in ``self.venue_changes``.
+        """
+        logger.info('Processing gig: %s at %s on %s.' % (gig.artist,
+            gig.venue, gig.date))
+        # Find or create the gig's artist.
+        artist = resolver.get(ImportIdentifier.ARTIST_IMPORT_TYPE,
+            gig.artist)
+        if artist:
+            logger.debug('Found artist: %s.' % artist)
+        else:
+            artist = resolver.create(ImportIdentifier.ARTIST_IMPORT_TYPE,
+                gig.artist, logger)
+            if not artist:
+                fingerprints.fail(gig.key, gig.row)
+                return
+
+        # Find or create the gig's town.  Occasionally this isn't included
+        # in the Ripping Records table row for the gig, so just assume it's
+        # Edinburgh and change it manually later.  The default town is
+        # resolved like any other, so it's the same object as a town
+        # named in another row.
+        town_name = gig.town
+        if not town_name:
+            town_name = DEFAULT_TOWN
+            logger.debug('No town listed for gig; using default.')
+        town = resolver.get(ImportIdentifier.TOWN_IMPORT_TYPE, town_name)
+        if town:
+            logger.debug('Found town: %s.' % town)
+        else:
+            town = resolver.create(ImportIdentifier.TOWN_IMPORT_TYPE,
+                town_name, logger)
+
+        # Find or create the gig's venue.
+        venue = resolver.get(ImportIdentifier.VENUE_IMPORT_TYPE, gig.venue)
+        if venue:
+            logger.debug('Found venue: %s.' % venue)
+        elif town:
+            venue = resolver.create(ImportIdentifier.VENUE_IMPORT_TYPE,
+                gig.venue, logger, town=town)
+        if not venue:
+            fingerprints.fail(gig.key, gig.row)
+            return
+
+        # Find or create the promoter. The promoter isn't always listed for
+        # a gig, so only create it exists.
+        promoter = None
+        if gig.promoter:
+            promoter = resolver.get(ImportIdentifier.PROMOTER_IMPORT_TYPE,
+                gig.promoter)
+            if promoter:
+                logger.debug('Found promoter: %s.' % promoter)
+            else:
+                promoter = resolver.create(
+                    ImportIdentifier.PROMOTER_IMPORT_TYPE, gig.promoter,
+                    logger)
+        else:
+            logger.debug('No promoter found.')
+
+        # Find or create the gig, using a unique identifier based on the
+        # artist, venue, and date.
+        gig_id = gig_identifier(gig)
+        db_gig = resolver.get(ImportIdentifier.GIG_IMPORT_TYPE, gig_id)
+        if db_gig:
+            logger.info('Gig already exists.')
+            # If the gig already exists make sure it's marked appropriately
+            # as sold out, cancelled, or not.
+            if not db_gig.sold_out == gig.sold_out:
+                index.set_flag(db_gig, 'sold_out', gig.sold_out)
+                self.report.count('gig', 'updated')
+                logger.debug("Updated the gig's sold out flag.")
+            if not db_gig.cancelled == gig.cancelled:
+                index.set_flag(db_gig, 'cancelled', gig.cancelled)
+                self.report.count('gig', 'updated')
+                logger.debug("Updated the gig's cancelled flag.")
+            return
+        # Check to see if a gig by the same artist is already happening on
+        # the same day in a different venue.  If there is, this new gig may
+        # be that gig at a changed venue, but that can't be decided until
+        # the whole spreadsheet has been read.
+        db_gig = index.find_moved(artist, gig.date, venue)
+        if db_gig:
+            self.venue_changes.add(gig, artist, venue, promoter, db_gig)
+            return
+        # This is definitely a new gig we have here.
+        db_gig = self.create_gig(gig, artist, venue, promoter, logger)
+        index.add(db_gig)
+        resolver.add(ImportIdentifier.GIG_IMPORT_TYPE, gig_id, db_gig)
@@ -1,63 +1,166 @@
-import logging
-import logging.config
+import datetime
+import functools
+from optparse import make_option
 
-from django.conf import settings
 from django.core.management.base import NoArgsCommand
-try:
-    import pylast
-except ImportError:
-    pass
 
-from gigs.models import Artist
+from gigs.bulk import bulk_add_m2m, bulk_remove_m2m, chunks, m2m_pairs
+from gigs.enrichment import EnrichmentRunner
+from gigs.management import get_logger
+from gigs.models import Artist, SyncState
+from gigs.providers import get_lastfm_network, import_pylast
+
+
+# Based on a little bit of research, a match of .25 or greater seems to be
+# a good benchmark for similarity.
+MINIMUM_MATCH = 0.25
+# Number of artists looked up between checkpoints.
+BATCH_SIZE = 100
+# The ``SyncState`` used to checkpoint a run.
+PROVIDER = 'lastfm'
+COMMAND = 'link_similar_artists'
+
+
+def get_similar_artists(lastfm, name):
+    """
+    Look up the artists Last.fm considers similar to the named artist.
+    Returns a tuple of whether the artist was found on Last.fm and a list
+    of ``(name, match)`` tuples.
+    """
+    try:
+        similar_artists = lastfm.get_artist(name).get_similar()
+    except import_pylast().WSError:
+        return False, []
+    return True, [(str(similar_artist["item"]), similar_artist["match"])
+        for similar_artist in similar_artists]
+
+
+def artists_to_refresh(stale_after=None, budget=None, resume_from=None):
+    """
+    Return a list of ``(id, name)`` tuples for the published artists whose
+    similar artists should be looked up.  If ``stale_after`` (a
+    ``datetime.timedelta``) is given only artists that have never been
+    looked up, or were last looked up longer ago than that, are returned,
+    oldest first.  At most ``budget`` artists are returned if it's given.
+
+    When resuming an interrupted run ``resume_from`` is the time the run
+    started, and artists looked up since then are skipped.
+    """
+    artists = Artist.objects.published().order_by('similar_artists_synced',
+        'id').values_list('id', 'name')
+    if resume_from is not None:
+        artists = artists.exclude(similar_artists_synced__gte=resume_from)
+    if stale_after is None:
+        artists = list(artists)
+    else:
+        threshold = datetime.datetime.now() - stale_after
+        # Artists never looked up come first.  (Databases disagree on
+        # where NULLs are sorted, so they're fetched separately.)
+        artists = list(artists.filter(similar_artists_synced__isnull=True)) + \
+            list(artists.filter(similar_artists_synced__lt=threshold))
+    if budget:
+        artists = artists[:budget]
+    return artists
 
 
 class Command(NoArgsCommand):
     help = "Use Last.fm's API to link similar artists."
+    base_options = (
+        make_option('-w', '--workers', action='store', default=None,
+            type='int', help='Number of artists to look up at once.'),
+        make_option('-s', '--stale-after', action='store', default=None,
+            type='int', dest='stale_after',
+            help='Only look up new artists and those last looked up more than this many hours ago, oldest first.'),
+        make_option('-b', '--budget', action='store', default=0, type='int',
+            help='Look up at most this many artists. Default is no limit.'),
+    )
+    option_list = NoArgsCommand.option_list + base_options
 
     def handle_noargs(self, **options):
         """
         Use the Last.fm API to link similar artists.  The similarity is
         based in listenership.
+
+        The artists and the existing links between them are loaded once,
+        the links to add and remove are worked out in memory, and the
+        changes are made with one bulk insert and one bulk delete.  A link
+        is only removed if neither artist is similar to the other according
+        to Last.fm.
+
+        The time each artist was looked up is stored, so with the
+        ``--stale-after`` option only artists whose similar artists haven't
+        been looked up recently are refreshed.  The artists are looked up
+        and linked in batches, and an interrupted run is resumed by skipping
+        the artists it had already looked up.
         """
-        try:
-            pylast
-        except NameError:
+        if import_pylast() is None:
             return False
         # Create the logger we'll use to store all the output.
-        logging.config.fileConfig("logging.conf")
-        logger = logging.getLogger('RippedRecordsLogger')
+        logger = get_logger()
         logger.info('Linking similar artists.')
-        # Create a connection to the Last.fm API.
-        lastfm = pylast.get_lastfm_network(api_key=settings.LASTFM_API_KEY)
-        # Loop through every published artist and look on Last.fm for similar
-        # artists that are also in the system?
-        for artist in Artist.objects.published():
-            db_similar_artists = artist.similar_artists.published()
-            try:
-                lastfm_artist = lastfm.get_artist(artist.name)
-                similar_artists = lastfm_artist.get_similar()
-            except pylast.WSError:
-                # Couldn't find the artist on Last.fm.
-                continue
-            for similar_artist in similar_artists:
-                # Based on a little bit of research, a match of .25 or greater
-                # seems to be a good benchmark for similarity.
-                if similar_artist["match"] >= 0.25:
-                    try:
-                        db_similar_artist = Artist.objects.get(name=str(
-                            similar_artist["item"]))
-                        # If this is a new similar artist, add it to the set.
-                        if db_similar_artist not in db_similar_artists:
-                            artist.similar_artists.add(db_similar_artist)
-                            logger.info("%s similar (%f) to %s." % (
-                                db_similar_artist.name,
-                                similar_artist["match"], artist))
-                        # Make the reciprocal link if it doesn't exist.
-                        if artist not in \
-                                db_similar_artist.similar_artists.published():
-                            db_similar_artist.similar_artists.add(artist)
-                            logger.info("%s similar (%f) to %s." % (artist,
-                                similar_artist["match"],
-                                db_similar_artist.name))
-                    except Artist.DoesNotExist:
-                        pass
+        # Get the connection to the Last.fm API.
+        lastfm = get_lastfm_network()
+        artist_ids = dict(Artist.objects.values_list('name', 'id'))
+        artist_names = dict((pk, name) for name, pk in artist_ids.items())
+        # The join table holds a row for each direction of a link.
+        existing_links = m2m_pairs(Artist, 'similar_artists')
+        # Look on Last.fm for artists similar to the published artists.
+        stale_after = options.get('stale_after')
+        if stale_after is not None:
+            stale_after = datetime.timedelta(hours=stale_after)
+        state = SyncState.objects.get_state(PROVIDER, COMMAND)
+        if state.is_interrupted():
+            logger.info('Resuming the run started at %s.' % state.high_water)
+            started = state.high_water
+            artists = artists_to_refresh(stale_after, options.get('budget'),
+                started)
+        else:
+            started = datetime.datetime.now()
+            artists = artists_to_refresh(stale_after, options.get('budget'))
+        logger.debug('Looking up %d artists.' % len(artists))
+        runner = EnrichmentRunner(options.get('workers'), logger)
+        found = set()
+        links = set()
+        for start in range(0, len(artists), BATCH_SIZE):
+            batch = artists[start:start + BATCH_SIZE]
+            results = runner.run([functools.partial(get_similar_artists,
+                lastfm, name) for pk, name in batch])
+            # Work out which links should exist, based on the artists that
+            # have been found on Last.fm so far.
+            looked_up = []
+            for (artist_id, name), result in zip(batch, results):
+                if result is None:
+                    # The request failed, so try again next time.
+                    continue
+                looked_up.append(artist_id)
+                artist_found, similar_artists = result
+                if not artist_found:
+                    # Couldn't find the artist on Last.fm.
+                    continue
+                found.add(artist_id)
+                for similar_name, match in similar_artists:
+                    similar_id = artist_ids.get(similar_name)
+                    if match >= MINIMUM_MATCH and similar_id is not None and \
+                            similar_id != artist_id:
+                        links.add((artist_id, similar_id))
+                        links.add((similar_id, artist_id))
+            new_links = links.difference(existing_links)
+            old_links = set([(from_id, to_id)
+                for from_id, to_id in existing_links
+                if from_id in found and to_id in found and
+                (from_id, to_id) not in links])
+            bulk_add_m2m(Artist, 'similar_artists', new_links)
+            bulk_remove_m2m(Artist, 'similar_artists', old_links)
+            existing_links.update(new_links)
+            existing_links.difference_update(old_links)
+            for chunk in chunks(looked_up):
+                Artist.objects.filter(id__in=chunk).update(
+                    similar_artists_synced=started)
+            state.checkpoint(batch[-1][0], started)
+            for from_id, to_id in new_links:
+                logger.info("%s similar to %s." % (artist_names[to_id],
+                    artist_names[from_id]))
+            for from_id, to_id in old_links:
+                logger.info("%s no longer similar to %s." % (
+                    artist_names[to_id], artist_names[from_id]))
+        state.finish(started)
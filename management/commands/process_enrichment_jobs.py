@@ -0,0 +1,102 @@
+import datetime
+import functools
+from optparse import make_option
+import traceback
+
+from django.core.management.base import NoArgsCommand
+
+from gigs.bulk import filter_in
+from gigs.enrichment import EnrichmentRunner
+from gigs.management import get_logger
+from gigs.models import EnrichmentJob
+
+
+# Number of times a job is attempted before it's given up on.
+MAX_ATTEMPTS = 5
+# Number of jobs fetched from the queue at a time.
+BATCH_SIZE = 50
+
+
+def run_job(job, logger):
+    """
+    Run a single enrichment job.  The job is deleted if it succeeds;
+    otherwise it's put back on the queue to be retried after a delay that
+    doubles with each failed attempt.  Returns ``True`` if the job was
+    successful, ``False`` if it failed, and ``None`` if another worker is
+    already running it.
+    """
+    # Claim the job by incrementing its number of attempts.  If another
+    # worker has got there first no row will be updated.
+    claimed = EnrichmentJob.objects.filter(pk=job.pk,
+        attempts=job.attempts).update(attempts=job.attempts + 1)
+    if not claimed:
+        return None
+    job.attempts += 1
+    try:
+        job.run()
+    except job.get_object_model().DoesNotExist:
+        # The artist or album has been deleted since the job was queued.
+        pass
+    except Exception:
+        delay = datetime.timedelta(minutes=2 ** job.attempts)
+        EnrichmentJob.objects.filter(pk=job.pk).update(
+            run_after=datetime.datetime.now() + delay,
+            last_error=traceback.format_exc())
+        logger.error("Job '%s' failed (attempt %d)." % (job, job.attempts))
+        return False
+    EnrichmentJob.objects.filter(pk=job.pk).delete()
+    logger.debug("Job '%s' complete." % job)
+    return True
+
+
+class Command(NoArgsCommand):
+    help = "Fetches queued metadata for artists and albums from Last.fm and MusicBrainz."
+    base_options = (
+        make_option('-l', '--limit', action='store', default=0, type='int',
+            help='Run at most this many jobs. Default is to run every job in the queue.'),
+        make_option('-w', '--workers', action='store', default=None,
+            type='int', help='Number of jobs to run at once.'),
+    )
+    option_list = NoArgsCommand.option_list + base_options
+
+    def handle_noargs(self, **options):
+        """
+        Run every enrichment job in the queue that's due, highest priority
+        first, until the queue is empty or the limit has been reached.
+        Jobs are run by a pool of workers, limited by the rate at which
+        each API can be used.
+        """
+        logger = get_logger()
+        logger.info('Processing enrichment jobs.')
+        limit = options.get('limit', 0)
+        runner = EnrichmentRunner(options.get('workers'), logger)
+        completed = failed = 0
+        # Completed jobs are deleted and failed jobs are put back on the
+        # queue with a delay, so neither is due again straight away.  A job
+        # being run by another worker is still due, though, so keep track
+        # of those jobs and leave them out of the query until they're no
+        # longer due.
+        busy = set()
+        while not limit or completed + failed < limit:
+            if busy:
+                busy = set(filter_in(EnrichmentJob.objects.due(
+                    MAX_ATTEMPTS).values_list('pk', flat=True), 'pk', busy))
+            jobs = EnrichmentJob.objects.due(MAX_ATTEMPTS)
+            if busy:
+                jobs = jobs.exclude(pk__in=busy)
+            number = BATCH_SIZE
+            if limit:
+                number = min(number, limit - completed - failed)
+            jobs = list(jobs[:number])
+            if not jobs:
+                break
+            results = runner.run([functools.partial(run_job, job, logger)
+                for job in jobs])
+            for job, result in zip(jobs, results):
+                if result:
+                    completed += 1
+                elif result is None:
+                    busy.add(job.pk)
+                else:
+                    failed += 1
+        logger.info('%d jobs complete, %d failed.' % (completed, failed))
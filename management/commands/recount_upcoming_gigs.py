@@ -0,0 +1,20 @@
+from django.core.management.base import NoArgsCommand
+from django.utils.encoding import force_unicode
+
+from gigs.counters import recount_upcoming_gigs
+
+
+class Command(NoArgsCommand):
+    help = "Recounts the number of upcoming gigs for every artist, venue, town, and promoter."
+
+    def handle_noargs(self, **options):
+        """
+        Update the ``number_of_upcoming_gigs`` field of every artist,
+        venue, town, and promoter whose number of upcoming gigs has
+        changed.
+        """
+        updated = recount_upcoming_gigs()
+        if int(options.get('verbosity', 1)) > 0:
+            return '\n'.join(['Updated %d %s.' % (number,
+                force_unicode(model._meta.verbose_name_plural))
+                for model, number in updated])
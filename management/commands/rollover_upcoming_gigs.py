@@ -0,0 +1,21 @@
+from django.core.management.base import NoArgsCommand
+from django.utils.encoding import force_unicode
+
+from gigs.counters import rollover_upcoming_gigs
+
+
+class Command(NoArgsCommand):
+    help = "Removes gigs that have taken place from the number of upcoming gigs for each artist, venue, town, and promoter."
+
+    def handle_noargs(self, **options):
+        """
+        Update the ``number_of_upcoming_gigs`` field of the artists,
+        venues, towns, and promoters whose gigs have taken place since the
+        command was last run.  This is designed to be run as a daily cron
+        job shortly after midnight.
+        """
+        updated = rollover_upcoming_gigs()
+        if int(options.get('verbosity', 1)) > 0:
+            return '\n'.join(['Updated %d %s.' % (number,
+                force_unicode(model._meta.verbose_name_plural))
+                for model, number in updated])
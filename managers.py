@@ -41,3 +41,115 @@ class GigManager(PublishedManager):
         """Return related gigs that have already taken place."""
         today = datetime.date.today()
         return self.published(date__lt=today, **kwargs)
+
+
+class EnrichmentJobManager(Manager):
+
+    """
+    Django model manager for the ``EnrichmentJob`` model.  Adds an
+    ``enqueue()`` method that creates a job only if an identical one isn't
+    already waiting, and a ``due()`` method that returns the jobs ready to
+    be run.
+    """
+
+    def enqueue(self, task, object_id, priority=0):
+        """
+        Add a job to the queue, returning the job.  If the same task is
+        already queued for the object the existing job is returned, with
+        its priority raised if necessary.
+        """
+        job, created = self.get_or_create(task=task, object_id=object_id,
+            defaults={'priority': priority})
+        if not created and job.priority < priority:
+            job.priority = priority
+            job.save()
+        return job
+
+    def due(self, max_attempts, **kwargs):
+        """
+        Return a ``QuerySet`` of jobs that are ready to be run, highest
+        priority first, excluding jobs that have already failed
+        ``max_attempts`` times.
+        """
+        return self.get_query_set().filter(attempts__lt=max_attempts,
+            run_after__lte=datetime.datetime.now(), **kwargs).order_by(
+            '-priority', 'run_after', 'id')
+
+
+class ProviderMissManager(Manager):
+
+    """
+    Django model manager for the ``ProviderMiss`` model.  Adds methods to
+    check whether a lookup is known to find nothing, to make a lookup, and
+    to record, re-check, or forget a lookup that found nothing.
+    """
+
+    def is_known(self, artist, lookup):
+        """
+        Return ``True`` if the lookup found nothing for the artist last
+        time and it isn't yet due to be checked again.
+        """
+        return self.get_query_set().filter(artist=artist, lookup=lookup,
+            next_check__gt=datetime.datetime.now()).count() > 0
+
+    def look_up(self, artist, lookup, func, *args, **kwargs):
+        """
+        Make a lookup for the artist by calling a function, and return its
+        result.  If the lookup found nothing before, the provider is asked
+        again rather than the empty response being read from the HTTP
+        cache, which keeps it for longer than the first re-check interval.
+        """
+        from gigs.httpcache import get_cache
+        if self.get_query_set().filter(artist=artist, lookup=lookup).count():
+            return get_cache().refresh(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def record(self, artist, lookup):
+        """
+        Record that the lookup found nothing for the artist.  The time
+        until it's checked again doubles with each consecutive miss, up to
+        the model's ``MAX_RECHECK_INTERVAL``.
+        """
+        now = datetime.datetime.now()
+        miss, created = self.get_or_create(artist=artist, lookup=lookup,
+            defaults={'next_check': now})
+        interval = min(self.model.MAX_RECHECK_INTERVAL,
+            self.model.FIRST_RECHECK_INTERVAL * 2 ** miss.misses)
+        miss.misses += 1
+        miss.next_check = now + interval
+        miss.save()
+        return miss
+
+    def recheck(self, artist):
+        """
+        Make all the artist's missed lookups due to be checked again now,
+        bypassing the HTTP cache, with the interval before the following
+        check starting again from the first.
+        """
+        self.get_query_set().filter(artist=artist).update(misses=0,
+            next_check=datetime.datetime.now())
+
+    def forget(self, artist, lookup=None):
+        """
+        Forget the recorded misses for the artist, either for one lookup
+        or, if ``lookup`` is ``None``, for all of them.
+        """
+        misses = self.get_query_set().filter(artist=artist)
+        if lookup is not None:
+            misses = misses.filter(lookup=lookup)
+        misses.delete()
+
+
+class SyncStateManager(Manager):
+
+    """
+    Django model manager for the ``SyncState`` model.  Adds a
+    ``get_state()`` method that returns the state for a provider and
+    command, creating it if necessary.
+    """
+
+    def get_state(self, provider, command):
+        """Return the ``SyncState`` for a provider and management command."""
+        state, created = self.get_or_create(provider=provider,
+            command=command)
+        return state
@@ -1,9 +1,6 @@
 import base64
 import datetime
 import hashlib
-import os
-import unicodedata
-import urllib2
 
 from django.conf import settings
 from django.db import models
@@ -11,18 +8,19 @@ from django.db.models import Count, permalink
 from django.db.models.signals import post_save
 from django.utils.dateformat import format
 from django.utils.html import strip_tags, urlize
-from markdown import markdown
-try:
-    from musicbrainz2.webservice import Query, ReleaseFilter, Release,\
-        ArtistFilter
-except ImportError:
-    pass
-try:
-    import pylast
-except ImportError:
-    pass
 
-from gigs.managers import PublishedManager, GigManager
+from gigs.bulk import bulk_insert, chunks
+from gigs.managers import PublishedManager, GigManager, EnrichmentJobManager,\
+    ProviderMissManager, SyncStateManager
+
+# The Last.fm and MusicBrainz libraries, the HTTP code, and Markdown are
+# imported within the methods that use them, so serving a page doesn't
+# pay for importing them.
+
+
+def identifier_digest(identifier):
+    """Return the digest used to look up an ``ImportIdentifier``."""
+    return hashlib.sha1(unicode(identifier).encode('utf-8')).hexdigest()
 
 
 class ImportIdentifier(models.Model):
@@ -35,6 +33,9 @@ class ImportIdentifier(models.Model):
     spellings (or misspell) the names of artists or venues especially.  But
     instead of needing multiple database rows for the same object, this
     identifier is used to link the many spellings to one model object.
+
+    Identifiers are looked up by ``digest``, a fixed-width hash of the
+    identifier that's indexed with the type.
     """
 
     GIG_IMPORT_TYPE = 1
@@ -51,15 +52,248 @@ class ImportIdentifier(models.Model):
     )
 
     identifier = models.CharField(max_length=128)
+    digest = models.CharField(max_length=40, editable=False)
     type = models.IntegerField(choices=IMPORT_TYPES)
 
     class Meta:
         ordering = ('identifier',)
-        unique_together = (('identifier', 'type'),)
+        unique_together = (('identifier', 'type'), ('digest', 'type'))
 
     def __unicode__(self):
         return self.identifier
 
+    def save(self, *args, **kwargs):
+        self.digest = identifier_digest(self.identifier)
+        super(ImportIdentifier, self).save(*args, **kwargs)
+
+
+class ArchivedImportIdentifier(models.Model):
+
+    """
+    An ``ImportIdentifier`` removed by the ``compact_import_identifiers``
+    command because the gig it identified has taken place, along with the
+    id of the object it was linked to.
+    """
+
+    identifier = models.CharField(max_length=128)
+    type = models.IntegerField(choices=ImportIdentifier.IMPORT_TYPES)
+    object_id = models.PositiveIntegerField()
+    archived = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        ordering = ('-archived', 'identifier')
+
+    def __unicode__(self):
+        return self.identifier
+
+
+class RowFingerprint(models.Model):
+
+    """
+    A hash of a gig row in the Ripping Records spreadsheet, as it was when
+    it was last imported successfully.
+
+    The ``key`` identifies the row (its date, artist, and the month and
+    year it was listed under) and the ``fingerprint`` is a hash of the
+    row's content.  Incremental imports use the two to skip rows that
+    haven't changed since the last import.
+
+    A row that couldn't be imported is stored with a blank fingerprint, the
+    row itself in ``row``, and the number of imports in a row it has failed
+    in, so it can be tried again without downloading the spreadsheet.
+    """
+
+    key = models.CharField(max_length=40, unique=True)
+    fingerprint = models.CharField(max_length=40, blank=True)
+    row = models.TextField(blank=True)
+    failures = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+
+    def __unicode__(self):
+        return self.key
+
+
+class SyncState(models.Model):
+
+    """
+    Records how far a management command has got with a provider of data,
+    so the command can carry on from where it left off the next time it's
+    run.
+
+    ``position`` holds the last position completed (a page number or an
+    object id, for example) and ``high_water`` the date and time of the
+    most recent data seen.  A command checkpoints its position as it goes
+    and clears it when it finishes, so a non-blank position means the last
+    run was interrupted.  ``etag`` and ``last_modified`` hold the HTTP
+    validators of the last document imported, if any.
+    """
+
+    provider = models.CharField(max_length=32)
+    command = models.CharField(max_length=64)
+    position = models.CharField(max_length=256, blank=True)
+    high_water = models.DateTimeField(blank=True, null=True)
+    etag = models.CharField(max_length=256, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+
+    objects = SyncStateManager()
+
+    class Meta:
+        ordering = ('provider', 'command')
+        unique_together = (('provider', 'command'),)
+
+    def __unicode__(self):
+        return "%s: %s" % (self.provider, self.command)
+
+    def is_interrupted(self):
+        """Return True if the last run didn't finish, False otherwise."""
+        return self.position != ''
+
+    def checkpoint(self, position, high_water=None):
+        """Record the last position completed and save the state."""
+        self.position = unicode(position)
+        if high_water is not None:
+            self.high_water = high_water
+        self.save()
+
+    def finish(self, high_water=None):
+        """Record that a run has finished and save the state."""
+        self.position = ''
+        if high_water is not None:
+            self.high_water = high_water
+        self.save()
+
+
+class ImportRun(models.Model):
+
+    """
+    The report of one run of an import command: how long it took, how
+    many database queries it made, its peak memory use, and the full report
+    as JSON, so the cost of imports can be tracked over time.
+    """
+
+    command = models.CharField(max_length=64)
+    started = models.DateTimeField()
+    duration = models.FloatField(help_text='Seconds.')
+    queries = models.PositiveIntegerField()
+    peak_memory = models.PositiveIntegerField(help_text='Kilobytes.')
+    report = models.TextField()
+
+    class Meta:
+        get_latest_by = 'started'
+        ordering = ('-started',)
+
+    def __unicode__(self):
+        return "%s at %s" % (self.command, self.started)
+
+
+class EnrichmentJob(models.Model):
+
+    """
+    A request to fetch an artist's or album's metadata from Last.fm or
+    MusicBrainz.
+
+    Jobs are queued when artists and albums are created, and run by the
+    ``process_enrichment_jobs`` command, so saving a model never has to
+    wait for an external API.  Only one job is queued for each task and
+    object; failed jobs are retried with an increasing delay.
+    """
+
+    ARTIST_METADATA_TASK = 'artist_metadata'
+    ALBUM_SET_TASK = 'album_set'
+    COVER_ART_TASK = 'cover_art'
+    ARTIST_COVER_ART_TASK = 'artist_cover_art'
+    TASKS = (
+        (ARTIST_METADATA_TASK, 'Artist photo, biography, and MusicBrainz id'),
+        (ALBUM_SET_TASK, 'Artist albums'),
+        (COVER_ART_TASK, 'Album cover art'),
+        (ARTIST_COVER_ART_TASK, 'Cover art for all artist albums'),
+    )
+    HIGH_PRIORITY = 10
+    NORMAL_PRIORITY = 0
+    LOW_PRIORITY = -10
+
+    task = models.CharField(max_length=32, choices=TASKS)
+    object_id = models.PositiveIntegerField()
+    priority = models.IntegerField(default=NORMAL_PRIORITY)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=datetime.datetime.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    objects = EnrichmentJobManager()
+
+    class Meta:
+        ordering = ('-priority', 'run_after')
+        unique_together = (('task', 'object_id'),)
+
+    def __unicode__(self):
+        return "%s %d" % (self.task, self.object_id)
+
+    def get_object_model(self):
+        """Return the model of the object the job is for."""
+        if self.task == EnrichmentJob.COVER_ART_TASK:
+            return Album
+        return Artist
+
+    def get_object(self):
+        """Return the artist or album the job is for."""
+        return self.get_object_model().objects.get(pk=self.object_id)
+
+    def run(self):
+        """Fetch the metadata from the external APIs."""
+        obj = self.get_object()
+        if self.task == EnrichmentJob.ARTIST_METADATA_TASK:
+            obj.get_photo()
+            obj.get_biography()
+            obj.get_musicbrainz_id()
+        elif self.task == EnrichmentJob.ALBUM_SET_TASK:
+            obj.populate_album_set()
+        elif self.task == EnrichmentJob.COVER_ART_TASK:
+            obj.get_cover_art()
+        elif self.task == EnrichmentJob.ARTIST_COVER_ART_TASK:
+            for album in obj.album_set.filter(cover_art=''):
+                album.get_cover_art()
+
+
+class ProviderMiss(models.Model):
+
+    """
+    A record that looking an artist up on Last.fm or MusicBrainz found
+    nothing.
+
+    Most of the artists playing local gigs are unknown to the providers, so
+    rather than looking them up again on every run the lookup is skipped
+    until ``next_check``.  The interval before the next check doubles with
+    each consecutive miss.
+    """
+
+    LASTFM_PHOTO_LOOKUP = 'lastfm_photo'
+    MUSICBRAINZ_ARTIST_LOOKUP = 'musicbrainz_artist'
+    MUSICBRAINZ_ALBUMS_LOOKUP = 'musicbrainz_albums'
+    LOOKUPS = (
+        (LASTFM_PHOTO_LOOKUP, 'Last.fm photo'),
+        (MUSICBRAINZ_ARTIST_LOOKUP, 'MusicBrainz id'),
+        (MUSICBRAINZ_ALBUMS_LOOKUP, 'MusicBrainz albums'),
+    )
+    FIRST_RECHECK_INTERVAL = datetime.timedelta(days=1)
+    MAX_RECHECK_INTERVAL = datetime.timedelta(days=90)
+
+    artist = models.ForeignKey('Artist')
+    lookup = models.CharField(max_length=32, choices=LOOKUPS)
+    misses = models.PositiveIntegerField(default=0)
+    next_check = models.DateTimeField()
+    updated = models.DateTimeField(auto_now=True, editable=False)
+
+    objects = ProviderMissManager()
+
+    class Meta:
+        ordering = ('artist', 'lookup')
+        unique_together = (('artist', 'lookup'),)
+
+    def __unicode__(self):
+        return "%s: %s" % (self.artist, self.get_lookup_display())
+
 
 class Gig(models.Model):
 
@@ -148,6 +382,8 @@ class Artist(models.Model):
     number_of_upcoming_gigs = models.IntegerField(default=0, editable=False)
     mbid = models.CharField(verbose_name='MusicBrainz id', max_length=36,
         blank=True)
+    similar_artists_synced = models.DateTimeField(blank=True, null=True,
+        editable=False)
     published = models.BooleanField(default=True)
     created = models.DateTimeField(auto_now_add=True, editable=False)
     updated = models.DateTimeField(auto_now=True, editable=False)
@@ -192,6 +428,7 @@ class Artist(models.Model):
                 self.number_of_upcoming_gigs = ordered_gig_count['num_of_artists']
             except IndexError:
                 self.number_of_upcoming_gigs = 0  # No gigs yet.
+        from markdown import markdown
         self.biography_html = markdown(urlize(self.biography, trim_url_limit=40,
             nofollow=False))
         super(Artist, self).save(force_insert, force_update)
@@ -201,56 +438,79 @@ class Artist(models.Model):
         Find and create models for all albums released by this artist.
         Only albums with an Amazon ASIN are imported, to try and stop the
         database getting clogged up with b-sides, remixes, and bonus
-        material.
+        material.  New albums are inserted in bulk, and a single job is
+        queued to fetch their cover art.
         """
+        from gigs.providers import get_musicbrainz_query, import_musicbrainz
         # We can't do anything without the MusicBrainz and Last.fm libraries.
-        try:
-            ReleaseFilter
-        except NameError:
+        webservice = import_musicbrainz()
+        if webservice is None:
+            return False
+        if ProviderMiss.objects.is_known(self,
+                ProviderMiss.MUSICBRAINZ_ALBUMS_LOOKUP):
             return False
         # Find any official album release held by MusicBrainz for this artist.
-        filter = ReleaseFilter(artistName=self.name, releaseTypes=(Release.TYPE_ALBUM,
-            Release.TYPE_OFFICIAL))
-        query = Query()
-        releases = query.getReleases(filter)
-        for release in releases:
-            album = release.release
-            # Only import albums with an Amazon ASIN.  That allows for some
-            # quality-control as Music Brainz lists every B-side and bonus
-            # material you can think of.
-            if album.asin:
-                # First try and find an already-existing album with this ASIN
-                # As an ASIN is unique it means we'll find it even if the fields
-                # have been changed since creation.
-                try:
-                    db_album = Album.objects.get(asin=album.asin)
-                except Album.DoesNotExist:
-                    db_album = Album(artist=self, title=album.title,
-                        asin=album.asin, mbid=album.id.rsplit("/", 1)[1])
-                    # MusicBrainz stores releases dates for as many countries as
-                    # it can.  I'm only interested in Britain though, so look
-                    # for that first.  As a fallback, us the world wide release
-                    # date (XE) or the US release date.
-                    release_dates = dict((r.country, r.date)
-                        for r in album.releaseEvents)
-                    if release_dates:
-                        # GB = United Kingdom, XE = world, US = United States.
-                        for country in ('GB', 'XE', 'US'):
-                            if release_dates.has_key(country):
-                                db_album.released_in = country
-                                # The release date can be in the format "2010",
-                                # "2010-02", or "2010-02-18", so make up the
-                                # missing month and/or day so a proper release
-                                # date object can be created.
-                                release_date = release_dates[country]
-                                date_list = map(int, release_date.split('-'))
-                                try:
-                                    db_album.release_date = datetime.date(
-                                        *date_list + [1] * (3 - len(date_list)))
-                                except ValueError:
-                                    pass  # Date couldn't be parsed.
-                                break
-                    db_album.save()
+        Release = webservice.Release
+        filter = webservice.ReleaseFilter(artistName=self.name,
+            releaseTypes=(Release.TYPE_ALBUM, Release.TYPE_OFFICIAL))
+        query = get_musicbrainz_query()
+        releases = ProviderMiss.objects.look_up(self,
+            ProviderMiss.MUSICBRAINZ_ALBUMS_LOOKUP, query.getReleases, filter)
+        # Only import albums with an Amazon ASIN.  That allows for some
+        # quality-control as Music Brainz lists every B-side and bonus
+        # material you can think of.
+        albums = [release.release for release in releases
+            if release.release.asin]
+        if albums:
+            ProviderMiss.objects.forget(self,
+                ProviderMiss.MUSICBRAINZ_ALBUMS_LOOKUP)
+        else:
+            ProviderMiss.objects.record(self,
+                ProviderMiss.MUSICBRAINZ_ALBUMS_LOOKUP)
+        # Find the albums that already exist, in one query.  As an ASIN is
+        # unique it means we'll find them even if the fields have been
+        # changed since creation.
+        asins = set(album.asin for album in albums)
+        existing_asins = set()
+        for chunk in chunks(asins):
+            existing_asins.update(Album.objects.filter(
+                asin__in=chunk).values_list('asin', flat=True))
+        new_albums = []
+        for album in albums:
+            if album.asin in existing_asins:
+                continue
+            existing_asins.add(album.asin)
+            db_album = Album(artist=self, title=album.title,
+                asin=album.asin, mbid=album.id.rsplit("/", 1)[1])
+            # MusicBrainz stores releases dates for as many countries as
+            # it can.  I'm only interested in Britain though, so look
+            # for that first.  As a fallback, us the world wide release
+            # date (XE) or the US release date.
+            release_dates = dict((r.country, r.date)
+                for r in album.releaseEvents)
+            if release_dates:
+                # GB = United Kingdom, XE = world, US = United States.
+                for country in ('GB', 'XE', 'US'):
+                    if release_dates.has_key(country):
+                        db_album.released_in = country
+                        # The release date can be in the format "2010",
+                        # "2010-02", or "2010-02-18", so make up the
+                        # missing month and/or day so a proper release
+                        # date object can be created.
+                        release_date = release_dates[country]
+                        date_list = map(int, release_date.split('-'))
+                        try:
+                            db_album.release_date = datetime.date(
+                                *date_list + [1] * (3 - len(date_list)))
+                        except ValueError:
+                            pass  # Date couldn't be parsed.
+                        break
+            new_albums.append(db_album)
+        # The albums are inserted together, without sending signals, so one
+        # job is queued to get the cover art for all of them.
+        if bulk_insert(new_albums):
+            EnrichmentJob.objects.enqueue(EnrichmentJob.ARTIST_COVER_ART_TASK,
+                self.pk, EnrichmentJob.LOW_PRIORITY)
 
     def get_photo(self):
         """
@@ -258,47 +518,52 @@ class Artist(models.Model):
         find the primary image.  This requires the pylast module; if it isn't
         found nothing will be done.
         """
+        import urllib2
+        from gigs.images import ImageTooLarge, fetch_image
+        from gigs.providers import get_lastfm_network, import_pylast
         # Make sure the pylast module is available.
-        try:
-            pylast
-        except NameError:
+        pylast = import_pylast()
+        if pylast is None:
             return False
-        # Create a connection to the Last.fm API.
-        lastfm = pylast.get_lastfm_network(api_key=settings.LASTFM_API_KEY)
+        if ProviderMiss.objects.is_known(self,
+                ProviderMiss.LASTFM_PHOTO_LOOKUP):
+            return False
+        # Get the connection to the Last.fm API.
+        lastfm = get_lastfm_network()
         try:
             lastfm_artist = lastfm.get_artist(self.name)
-            lastfm_images = lastfm_artist.get_images()
+            lastfm_images = ProviderMiss.objects.look_up(self,
+                ProviderMiss.LASTFM_PHOTO_LOOKUP, lastfm_artist.get_images)
             primary_image = lastfm_images[0]
             try:
                 primary_image_url = primary_image.sizes.original
             except AttributeError:
                 primary_image_url = primary_image['sizes']['original']
-            # Read the image data from the URL supplied.
-            response = urllib2.urlopen(primary_image_url)
-            data = response.read()
             # Store the photo on disk.
-            filename = os.path.join(settings.MEDIA_ROOT,
-                Artist.PHOTO_UPLOAD_DIRECTORY, '%s.jpg' % self.slug)
-            fh = open(filename, 'w')
-            fh.write(data)
-            fh.close()
+            photo = fetch_image(primary_image_url,
+                Artist.PHOTO_UPLOAD_DIRECTORY)
             # Link the photo to the artist (i.e. save the Artist object).
-            self.photo = os.path.join(Artist.PHOTO_UPLOAD_DIRECTORY,
-                '%s.jpg' % self.slug)
-            self.save()
+            if self.photo != photo:
+                self.photo = photo
+                self.save()
         except (pylast.WSError, IndexError):
+            # The artist or their photo couldn't be found.
+            ProviderMiss.objects.record(self, ProviderMiss.LASTFM_PHOTO_LOOKUP)
+        except (ImageTooLarge, urllib2.URLError):
             pass
-
+        else:
+            ProviderMiss.objects.forget(self, ProviderMiss.LASTFM_PHOTO_LOOKUP)
 
     def get_biography(self):
         """Import artist briography from Last.fm."""
+        import urllib2
+        from gigs.providers import get_lastfm_network, import_pylast
         # Make sure the pylast module is available.
-        try:
-            pylast
-        except NameError:
+        pylast = import_pylast()
+        if pylast is None:
             return False
-        # Open a connection to the Last.fm API.
-        lastfm = pylast.get_lastfm_network(api_key=settings.LASTFM_API_KEY)
+        # Get the connection to the Last.fm API.
+        lastfm = get_lastfm_network()
         lastfm_artist = lastfm.get_artist(self.name)
         try:
             # Get the biography from Last.fm.
@@ -324,21 +589,29 @@ class Artist(models.Model):
         Retrieve the MusicBrainz id for this artist and save it on the
         model.
         """
-        # Make sure the useful bits of the musicbrainz2 package have been
-        # imported.
-        try:
-            Query, ArtistFilter
-        except NameError:
+        from gigs.providers import get_musicbrainz_query, import_musicbrainz
+        # Make sure the musicbrainz2 package is available.
+        webservice = import_musicbrainz()
+        if webservice is None:
+            return False
+        if ProviderMiss.objects.is_known(self,
+                ProviderMiss.MUSICBRAINZ_ARTIST_LOOKUP):
             return False
         # Query MusicBrainz.
-        artist_filter = ArtistFilter(name=self.name)
-        query = Query()
+        artist_filter = webservice.ArtistFilter(name=self.name)
+        query = get_musicbrainz_query()
         try:
-            artist = query.getArtists(artist_filter)[0].artist
+            artist = ProviderMiss.objects.look_up(self,
+                ProviderMiss.MUSICBRAINZ_ARTIST_LOOKUP, query.getArtists,
+                artist_filter)[0].artist
             self.mbid = artist.id.rsplit("/", 1)[1]
             self.save()
         except (IndexError, AttributeError):
+            ProviderMiss.objects.record(self,
+                ProviderMiss.MUSICBRAINZ_ARTIST_LOOKUP)
             return False
+        ProviderMiss.objects.forget(self,
+            ProviderMiss.MUSICBRAINZ_ARTIST_LOOKUP)
 
 
 class Album(models.Model):
@@ -379,30 +652,23 @@ class Album(models.Model):
 
     def get_cover_art(self):
         """Attempt to get the album's cover art from Last.fm."""
-        try:
-            pylast
-        except NameError:
+        import urllib2
+        from gigs.images import ImageTooLarge, fetch_image
+        from gigs.providers import get_lastfm_network, import_pylast
+        pylast = import_pylast()
+        if pylast is None:
             return False
-        album_id = unicodedata.normalize('NFKD',
-            unicode(' '.join([self.artist.name, self.title]))).encode('ascii',
-            'ignore')
-        album_hash = hashlib.sha1(album_id).hexdigest()
-        lastfm = pylast.get_lastfm_network(api_key=settings.LASTFM_API_KEY)
+        lastfm = get_lastfm_network()
         lastfm_album = lastfm.get_album(self.artist.name, self.title)
         try:
             cover_image = lastfm_album.get_cover_image()
-            response = urllib2.urlopen(cover_image)
-            data = response.read()
             # Store the photo on disk and link the photo to the album.
-            filename = os.path.join(settings.MEDIA_ROOT,
-                Album.PHOTO_UPLOAD_DIRECTORY, '%s.jpg' % album_hash)
-            fh = open(filename, 'w')
-            fh.write(data)
-            fh.close()
-            self.cover_art = os.path.join(Album.PHOTO_UPLOAD_DIRECTORY,
-                '%s.jpg' % album_hash)
-            self.save()
-        except (pylast.WSError, AttributeError, urllib2.HTTPError):
+            cover_art = fetch_image(cover_image, Album.PHOTO_UPLOAD_DIRECTORY)
+            if self.cover_art != cover_art:
+                self.cover_art = cover_art
+                self.save()
+        except (pylast.WSError, AttributeError, urllib2.URLError,
+                ImageTooLarge):
             pass
 
 
@@ -467,6 +733,7 @@ class Venue(models.Model):
                 self.number_of_upcoming_gigs = ordered_gig_count['num_of_venues']
             except IndexError:
                 self.number_of_upcoming_gigs = 0  # No gigs yet.
+        from markdown import markdown
         self.description_html = markdown(urlize(self.description,
             trim_url_limit=40, nofollow=False))
         super(Venue, self).save(force_insert, force_update)
@@ -627,31 +894,34 @@ post_save.connect(ensure_gig_slug_matches_artist_slug, sender=Artist)
 
 def populate_artist_metadata(sender, **kwargs):
     """
-    Signal receiver; called once an Artist model is saved, populating
-    the artist's photo and biography if the artist is a new creation.
+    Signal receiver; called once an Artist model is saved, queueing a job
+    to populate the artist's photo and biography if the artist is a new
+    creation.
     """
     if kwargs['created']:
-        kwargs['instance'].get_photo()
-        kwargs['instance'].get_biography()
-        kwargs['instance'].get_musicbrainz_id()
+        EnrichmentJob.objects.enqueue(EnrichmentJob.ARTIST_METADATA_TASK,
+            kwargs['instance'].pk, EnrichmentJob.HIGH_PRIORITY)
 post_save.connect(populate_artist_metadata, sender=Artist)
 
 
 def populate_artist_album_set(sender, **kwargs):
     """
-    Signal receiver; called once an Artist model is saved, populating
-    the artist's set of albums if the artist is a new creation.
+    Signal receiver; called once an Artist model is saved, queueing a job
+    to populate the artist's set of albums if the artist is a new
+    creation.
     """
     if kwargs['created']:
-        kwargs['instance'].populate_album_set()
+        EnrichmentJob.objects.enqueue(EnrichmentJob.ALBUM_SET_TASK,
+            kwargs['instance'].pk, EnrichmentJob.NORMAL_PRIORITY)
 post_save.connect(populate_artist_album_set, sender=Artist)
 
 
 def get_album_cover_art(sender, **kwargs):
     """
-    Signal receiver; called once an Album model is saved, getting the
-    album's cover art from Last.fm if it can.
+    Signal receiver; called once an Album model is saved, queueing a job
+    to get the album's cover art from Last.fm.
     """
     if kwargs['created']:
-        kwargs['instance'].get_cover_art()
+        EnrichmentJob.objects.enqueue(EnrichmentJob.COVER_ART_TASK,
+            kwargs['instance'].pk, EnrichmentJob.LOW_PRIORITY)
 post_save.connect(get_album_cover_art, sender=Album)
@@ -0,0 +1,181 @@
+from StringIO import StringIO
+import threading
+import urllib
+import urllib2
+
+from django.conf import settings
+
+from gigs.connections import build_opener, urlopen
+from gigs.enrichment import limited
+from gigs.httpcache import get_cache, get_ttl
+
+
+def import_pylast():
+    """
+    Return the ``pylast`` module, or ``None`` if it isn't installed.  It's
+    only imported when it's first needed, so processes that never talk to
+    Last.fm don't pay for it.
+    """
+    try:
+        import pylast
+    except ImportError:
+        return None
+    return pylast
+
+
+def import_musicbrainz():
+    """
+    Return the ``musicbrainz2.webservice`` module, or ``None`` if
+    musicbrainz2 isn't installed.  Like ``import_pylast()``, it's only
+    imported when it's first needed.
+    """
+    try:
+        from musicbrainz2 import webservice
+    except ImportError:
+        return None
+    return webservice
+
+
+class LastfmCacheBackend(object):
+
+    """
+    A pylast cache backend that stores responses in the shared
+    ``HTTPCache``.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def has_key(self, key):
+        return self.cache.get('lastfm:%s' % key) is not None
+
+    def get_xml(self, key):
+        entry = self.cache.get_entry('lastfm:%s' % key)
+        if entry is not None:
+            return entry['body']
+        return None
+
+    def set_xml(self, key, xml_string):
+        self.cache.set('lastfm:%s' % key, xml_string, get_ttl('lastfm'))
+
+
+_cached_web_service = None
+
+
+def get_cached_web_service_class(webservice):
+    """
+    Return a subclass of musicbrainz2's ``WebService`` that stores
+    responses in the shared ``HTTPCache`` and keeps to the MusicBrainz rate
+    limit.  The class is created the first time it's needed, as it can't
+    be defined until musicbrainz2 has been imported.
+    """
+    global _cached_web_service
+    if _cached_web_service is None:
+        WebService = webservice.WebService
+
+        class CachedWebService(WebService):
+
+            def get(self, entity, id_, include=(), filter={}, version='1'):
+                cache = get_cache()
+                url = self._makeUrl(entity, id_, include, filter, version)
+                body = cache.get(url)
+                if body is None:
+                    response = limited('musicbrainz', WebService.get, self,
+                        entity, id_, include, filter, version)
+                    try:
+                        body = response.read()
+                    finally:
+                        response.close()
+                    cache.set(url, body, get_ttl('musicbrainz'))
+                return StringIO(body)
+
+        _cached_web_service = CachedWebService
+    return _cached_web_service
+
+
+_lastfm_network = None
+_lastfm_network_lock = threading.Lock()
+
+
+def download_pylast_response(pylast, request):
+    """
+    Send a pylast request on a persistent connection from the shared pool,
+    and return the response body, as pylast's own
+    ``_Request._download_response()`` does.
+    """
+    data = '&'.join(['%s=%s' % (name, urllib.quote_plus(
+        pylast._string(value))) for name, value in request.params.items()])
+    host, path = request.network.ws_server
+    http_request = urllib2.Request('http://%s%s' % (host, path), data, {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept-Charset': 'utf-8',
+        'User-Agent': 'pylast/%s' % pylast.__version__,
+    })
+    try:
+        response = urlopen(http_request)
+    except urllib2.HTTPError, e:
+        # Last.fm describes the error in the body, which pylast turns into
+        # a ``WSError``.
+        response = e
+    try:
+        body = pylast._unicode(response.read())
+    finally:
+        response.close()
+    request._check_response_for_errors(body)
+    return body
+
+
+def patch_pylast_requests(pylast):
+    """
+    Make pylast send every request it doesn't find in the cache on a
+    persistent connection from the shared pool, and within the Last.fm
+    provider limits, so both the number of simultaneous requests and their
+    rate are limited.  Requests through a proxy are left to pylast.
+    """
+    download_response = pylast._Request._download_response
+    if getattr(download_response, 'patched', False):
+        return
+
+    def pooled_download_response(self):
+        if self.network.is_proxy_enabled():
+            return limited('lastfm', download_response, self)
+        return limited('lastfm', download_pylast_response, pylast, self)
+    pooled_download_response.patched = True
+    pylast._Request._download_response = pooled_download_response
+
+
+def get_lastfm_network():
+    """
+    Return a connection to the Last.fm API, shared by the whole process,
+    whose responses are cached.  Returns ``None`` if pylast isn't
+    installed.
+    """
+    global _lastfm_network
+    pylast = import_pylast()
+    if pylast is None:
+        return None
+    _lastfm_network_lock.acquire()
+    try:
+        if _lastfm_network is None:
+            patch_pylast_requests(pylast)
+            _lastfm_network = pylast.get_lastfm_network(
+                api_key=settings.LASTFM_API_KEY)
+            _lastfm_network.cache_backend = LastfmCacheBackend(get_cache())
+        return _lastfm_network
+    finally:
+        _lastfm_network_lock.release()
+
+
+def get_musicbrainz_query():
+    """
+    Return a MusicBrainz query object whose responses are cached, and
+    whose requests use persistent connections from the shared pool.
+    Returns ``None`` if musicbrainz2 isn't installed.
+    """
+    webservice = import_musicbrainz()
+    if webservice is None:
+        return None
+    # The web service adds its authentication handler to the opener, so
+    # each gets its own opener.
+    return webservice.Query(ws=get_cached_web_service_class(webservice)(
+        opener=build_opener()))
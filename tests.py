@@ -0,0 +1,262 @@
+import datetime
+import logging
+try:
+    import json
+except ImportError:
+    import simplejson as json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+
+from gigs import management
+from gigs.bulk import CHUNK_SIZE, chunks, filter_in
+from gigs.counters import UPCOMING_GIG_COUNTERS, count_upcoming_gigs,\
+    get_rollover_state, recount_upcoming_gigs, rollover_upcoming_gigs,\
+    set_rollover_date, update_counters
+from gigs.models import Gig, Artist, Venue, Town, Promoter
+
+
+class CounterTestCase(TestCase):
+
+    """
+    Tests for keeping the ``number_of_upcoming_gigs`` field of artists,
+    venues, towns, and promoters up-to-date.
+    """
+
+    def setUp(self):
+        self.today = datetime.date.today()
+        self.town = Town.objects.create(name='Edinburgh', slug='edinburgh')
+        self.venue = Venue.objects.create(name='Usher Hall',
+            slug='usher-hall', town=self.town)
+        self.promoter = Promoter.objects.create(name='RM', slug='rm')
+
+    def create_gigs(self, name, days):
+        """
+        Create an artist with a gig on each of the given days, counted
+        from today.
+        """
+        artist = Artist.objects.create(name=name, slug=name.lower())
+        for day in days:
+            Gig.objects.create(artist=artist, slug=artist.slug,
+                venue=self.venue, promoter=self.promoter,
+                date=self.today + datetime.timedelta(days=day))
+        return artist
+
+    def count_as_of(self, date):
+        """
+        Set every counter to its correct value as of ``date``, and record
+        that they're correct as of then.
+        """
+        gigs = Gig.objects.published(date__gte=date)
+        for model, lookup in UPCOMING_GIG_COUNTERS:
+            counts = count_upcoming_gigs(lookup, gigs)
+            update_counters(model, dict((pk, counts.get(pk, 0))
+                for pk in model.objects.values_list('id', flat=True)))
+        set_rollover_date(date)
+
+    def assertCountersCorrect(self):
+        for model, lookup in UPCOMING_GIG_COUNTERS:
+            for obj in model.objects.all():
+                self.assertEqual(obj.number_of_upcoming_gigs,
+                    Gig.objects.published(date__gte=self.today,
+                    **{lookup: obj}).count())
+
+    def test_rollover(self):
+        """
+        Gigs that have taken place since the last rollover are taken off
+        the counters, leaving the number of upcoming gigs.
+        """
+        self.create_gigs('Alpha', [-2, -1, 0, 1, 2])
+        self.create_gigs('Beta', [-3, -2, -1, 3, 4])
+        self.create_gigs('Gamma', [-1])
+        self.count_as_of(self.today - datetime.timedelta(days=3))
+        rollover_upcoming_gigs(self.today)
+        self.assertCountersCorrect()
+        self.assertEqual(Artist.objects.get(name='Alpha')
+            .number_of_upcoming_gigs, 3)
+        self.assertEqual(Artist.objects.get(name='Beta')
+            .number_of_upcoming_gigs, 2)
+        self.assertEqual(Venue.objects.get(pk=self.venue.pk)
+            .number_of_upcoming_gigs, 5)
+
+    def test_rollover_never_goes_below_zero(self):
+        """A counter that's too low is set to zero, not made negative."""
+        artist = self.create_gigs('Alpha', [-2, -1])
+        self.count_as_of(self.today - datetime.timedelta(days=2))
+        Artist.objects.filter(pk=artist.pk).update(number_of_upcoming_gigs=1)
+        rollover_upcoming_gigs(self.today)
+        self.assertEqual(Artist.objects.get(pk=artist.pk)
+            .number_of_upcoming_gigs, 0)
+
+    def test_recount(self):
+        """
+        A recount corrects every counter, and records that they're correct
+        as of today so a rollover today changes nothing.
+        """
+        self.create_gigs('Alpha', [-1, 0, 1])
+        self.create_gigs('Beta', [-2])
+        Artist.objects.update(number_of_upcoming_gigs=7)
+        Town.objects.update(number_of_upcoming_gigs=-1)
+        updated = dict(recount_upcoming_gigs())
+        self.assertCountersCorrect()
+        self.assertEqual(updated[Artist], 2)
+        self.assertEqual(updated[Promoter], 1)
+        self.assertEqual(get_rollover_state().high_water.date(), self.today)
+        self.assertEqual(rollover_upcoming_gigs(self.today), [])
+        self.assertCountersCorrect()
+
+    def test_first_rollover_recounts(self):
+        """
+        If the counters have never been brought up-to-date a rollover does
+        a full recount.
+        """
+        self.create_gigs('Alpha', [-1, 0, 1])
+        Artist.objects.update(number_of_upcoming_gigs=7)
+        rollover_upcoming_gigs(self.today)
+        self.assertCountersCorrect()
+
+    def test_unpublished_gigs_not_counted(self):
+        """Unpublished gigs aren't counted, or taken off the counters."""
+        artist = self.create_gigs('Alpha', [-1, 1])
+        Gig.objects.filter(date__lt=self.today).update(published=False)
+        self.count_as_of(self.today - datetime.timedelta(days=1))
+        rollover_upcoming_gigs(self.today)
+        self.assertCountersCorrect()
+        self.assertEqual(Artist.objects.get(pk=artist.pk)
+            .number_of_upcoming_gigs, 1)
+
+
+class BulkTestCase(TestCase):
+
+    """Tests for the bulk database helpers in ``gigs.bulk``."""
+
+    def test_chunks(self):
+        self.assertEqual(list(chunks(range(7), 3)), [[0, 1, 2], [3, 4, 5],
+            [6]])
+        self.assertEqual(list(chunks(range(6), 3)), [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(list(chunks([], 3)), [])
+
+    def test_chunks_of_iterator(self):
+        """An iterator is consumed a chunk at a time."""
+        consumed = []
+
+        def numbers():
+            for number in range(5):
+                consumed.append(number)
+                yield number
+        iterator = chunks(numbers(), 2)
+        self.assertEqual(iterator.next(), [0, 1])
+        self.assertEqual(consumed, [0, 1])
+        self.assertEqual(list(iterator), [[2, 3], [4]])
+
+    def test_filter_in(self):
+        """Every matching object is found, whatever the chunk size."""
+        names = ['Town %d' % i for i in range(5)]
+        for name in names:
+            Town.objects.create(name=name, slug=name.lower().replace(' ', '-'))
+        for size in (1, 2, CHUNK_SIZE):
+            self.assertEqual(sorted([town.name for town in filter_in(
+                Town.objects.all(), 'name', names[1:] + ['Nowhere'],
+                size)]), names[1:])
+
+    def test_filter_in_many_values(self):
+        """
+        More values than SQLite allows bound parameters in one query can be
+        given, and duplicates are only looked up once.
+        """
+        town = Town.objects.create(name='Edinburgh', slug='edinburgh')
+        ids = range(town.pk, town.pk + 2000) + [town.pk]
+        self.assertEqual(filter_in(Town.objects.all(), 'id', ids), [town])
+
+
+class ImportTestCase(TestCase):
+
+    """Tests for the ``import_gigs_from_ripping_records`` command."""
+
+    HEADER = '*OCTOBER %d*\n*DATE*,*ARTIST*,*VENUE*,*PRICE*\n'
+    LIQUID_ROOM = 'Thu 22nd,Alpha Band,Liquid Room Edinburgh,SOLD OUT\n'
+    USHER_HALL = 'Thu 22nd,Alpha Band,Usher Hall Edinburgh,?10.00\n'
+
+    def setUp(self):
+        # Don't configure logging from a ``logging.conf`` file.
+        management._logging_configured = True
+        logging.disable(logging.CRITICAL)
+        fd, self.path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.old_url = settings.RIPPING_RECORDS_SPREADSHEET_URL
+        settings.RIPPING_RECORDS_SPREADSHEET_URL = 'file://' + self.path
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        settings.RIPPING_RECORDS_SPREADSHEET_URL = self.old_url
+        os.remove(self.path)
+
+    def import_rows(self, *rows, **options):
+        """
+        Import a spreadsheet of the given rows, listed under October of
+        next year, and return the ``(artist, venue)`` of every gig.
+        """
+        fh = open(self.path, 'w')
+        try:
+            fh.write(self.HEADER % (datetime.date.today().year + 1))
+            fh.write(''.join(rows))
+        finally:
+            fh.close()
+        call_command('import_gigs_from_ripping_records', **options)
+        return sorted([(gig.artist.name, gig.venue.name)
+            for gig in Gig.objects.select_related()])
+
+    def import_report(self, *rows, **options):
+        """Import a spreadsheet of the given rows, returning its report."""
+        fd, report_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            self.import_rows(report=report_path, *rows, **options)
+            fh = open(report_path)
+            try:
+                return json.load(fh)
+            finally:
+                fh.close()
+        finally:
+            os.remove(report_path)
+
+    def test_venue_change(self):
+        """A gig listed at a new venue instead of its old one is moved."""
+        self.import_rows(self.LIQUID_ROOM)
+        self.assertEqual(self.import_rows(self.USHER_HALL),
+            [(u'Alpha Band', u'Usher Hall')])
+
+    def test_two_venues_on_one_day(self):
+        """
+        An artist listed at two venues on the same day has two gigs, and
+        importing the spreadsheet again doesn't change their flags.
+        """
+        for rows in ((self.LIQUID_ROOM, self.USHER_HALL),
+                (self.USHER_HALL, self.LIQUID_ROOM)):
+            Gig.objects.all().delete()
+            gigs = [(u'Alpha Band', u'Liquid Room'),
+                (u'Alpha Band', u'Usher Hall')]
+            self.assertEqual(self.import_rows(*rows), gigs)
+            self.assertEqual(self.import_rows(*rows), gigs)
+            self.assertEqual(Gig.objects.get(venue__name='Liquid Room')
+                .sold_out, True)
+            self.assertEqual(Gig.objects.get(venue__name='Usher Hall')
+                .sold_out, False)
+
+    def test_failed_rows_counted_as_retried(self):
+        """
+        A row that failed is retried on the next incremental import and
+        counted as retried, not changed.
+        """
+        # The second artist's slug is the same as the first's, so it can't
+        # be created.
+        rows = (self.LIQUID_ROOM,
+            'Fri 23rd,alpha band,Usher Hall Edinburgh,?10.00\n')
+        report = self.import_report(incremental=True, *rows)
+        self.assertEqual(report['counters']['gig']['failed'], 1)
+        report = self.import_report(incremental=True, *rows)
+        self.assertEqual(report['counters']['row'], {'new': 0, 'changed': 0,
+            'unchanged': 1, 'retried': 1, 'vanished': 0})